@@ -0,0 +1,65 @@
+"""
+Calls per second of the numerical ``*_data`` kernels against the plotting
+functions that wrap them. The difference is the cost of drawing, which a
+parameter sweep or a notebook slider pays on every call.
+
+Figures are drawn with the Agg backend and closed after each call. Run
+from the repository root:
+
+    python benchmarks/data_kernels.py
+"""
+import os
+import sys
+import timeit
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import scipy.io as sio  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vtoolbox import ema, sdof  # noqa: E402
+
+_data = sio.loadmat(os.path.join(ROOT, 'vtoolbox', 'data', 'frf_data1'))
+_saw = np.hstack((np.arange(-1, 1, .04), np.arange(1, -1, -.04))) + 1
+
+# name, arguments, shared by the kernel and its plotting wrapper
+CASES = [
+    ('steady_state_response', ([0.1, 0.3, 0.8], 0, 2)),
+    ('transmissibility', ([0.01, 0.05, 0.1, 0.25, 0.5, 0.7], 0, 2)),
+    ('rotating_unbalance', (1, 0.5, 0.1, [0.1, 0.25, 0.707, 1], 0, 3.5)),
+    ('impulse_response', (100, 20, 2000, 10, 100)),
+    ('step_response', (100, 20, 2000, 10, 100)),
+    ('fourier_series', (_saw, np.arange(len(_saw)) / len(_saw), 5)),
+    ('response_spectrum', (10,)),
+    ('fourier_approximation', (0, '-8/pi**2/n**2', 0, 0, 0, 20, 10)),
+    ('euler_beam_frf', ()),
+    ('ema.frf', (_data['x'].ravel(), _data['f'].ravel(),
+                 _data['dt'].item())),
+]
+
+
+def calls_per_second(func, args):
+    def call():
+        func(*args)
+        plt.close('all')
+    number, seconds = timeit.Timer(call).autorange()
+    return number / seconds
+
+
+def main():
+    print('%-24s %12s %12s %8s' % ('', 'kernel/s', 'plotting/s', 'ratio'))
+    for name, args in CASES:
+        module, _, func = name.rpartition('.')
+        module = ema if module == 'ema' else sdof
+        kernel = calls_per_second(getattr(module, func + '_data'), args)
+        plotting = calls_per_second(getattr(module, func), args)
+        print('%-24s %12.1f %12.1f %7.0fx' % (name, kernel, plotting,
+                                              kernel / plotting))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+free_response_batch against a loop of free_response (odeint) over many
+random single degree of freedom systems.
+
+Run from the repository root:
+
+    python benchmarks/free_response_batch.py [n_cases]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vtoolbox import sdof  # noqa: E402
+
+
+def main(n_cases=1000):
+    rng = np.random.default_rng(0)
+    m = rng.uniform(1, 10, n_cases)
+    c = rng.uniform(0.1, 5, n_cases)
+    k = rng.uniform(50, 500, n_cases)
+    x0 = rng.uniform(-1, 1, n_cases)
+    v0 = rng.uniform(-1, 1, n_cases)
+
+    t0 = time.perf_counter()
+    x_loop = np.array([sdof.free_response(*p)[1].ravel()
+                       for p in zip(m, c, k, x0, v0)])
+    t1 = time.perf_counter()
+    _, x_batch, *_ = sdof.free_response_batch(m, c, k, x0, v0)
+    t2 = time.perf_counter()
+
+    print('%d cases, %d samples each' % x_batch.shape)
+    print('looping free_response  %8.3f s' % (t1 - t0))
+    print('free_response_batch    %8.3f s   (%.0fx)' % (t2 - t1,
+                                                       (t1 - t0) / (t2 - t1)))
+    print('max difference         %8.1e' % abs(x_loop - x_batch).max())
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
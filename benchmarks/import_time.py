@@ -0,0 +1,64 @@
+"""
+Import time of vtoolbox and check that the numerical functions do not
+pull in the plotting and notebook packages.
+
+Each case runs in a fresh interpreter. Run from the repository root:
+
+    python benchmarks/import_time.py
+
+Exits with status 1 if matplotlib, IPython or ipywidgets is imported by
+anything but a plotting call.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLOTTING = ('matplotlib', 'IPython', 'ipywidgets')
+
+CASES = [
+    ('import vtoolbox', 'import vtoolbox', False),
+    ('import vtoolbox.sdof', 'import vtoolbox.sdof', False),
+    ('import vtoolbox.mdof', 'import vtoolbox.mdof', False),
+    ('import vtoolbox.ema', 'import vtoolbox.ema', False),
+    ('sdof kernel call',
+     'import vtoolbox.sdof as s; s.steady_state_response_data(0.1, 0, 2)',
+     False),
+    ('sdof plotting call',
+     'import matplotlib; matplotlib.use("Agg"); import vtoolbox.sdof as s; '
+     's.steady_state_response(0.1, 0, 2)', True),
+]
+
+TEMPLATE = '''
+import sys, time
+t0 = time.perf_counter()
+{code}
+t1 = time.perf_counter()
+print(t1 - t0)
+print(' '.join(m for m in {plotting!r} if m in sys.modules))
+'''
+
+
+def run(code):
+    out = subprocess.run(
+        [sys.executable, '-c', TEMPLATE.format(code=code, plotting=PLOTTING)],
+        cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True, check=True,
+        env=dict(os.environ, MPLBACKEND='Agg')).stdout.split('\n')
+    return float(out[0]), out[1].split()
+
+
+def main():
+    failed = False
+    for name, code, plots in CASES:
+        seconds, loaded = run(code)
+        ok = bool(loaded) == plots
+        failed |= not ok
+        print('%-24s %8.3f s   %-32s %s' % (name, seconds,
+                                           ' '.join(loaded) or '-',
+                                           'ok' if ok else 'FAIL'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
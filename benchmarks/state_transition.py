@@ -0,0 +1,36 @@
+"""
+state_transition (exact, matrix powers by doubling) against the Euler and
+Runge-Kutta loops for the free response of a single degree of freedom
+system.
+
+Run from the repository root:
+
+    python benchmarks/state_transition.py [n_steps]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vtoolbox import sdof  # noqa: E402
+
+
+def main(n_steps=1000000):
+    args = dict(m=1, c=.1, k=1, x0=1, v0=0, n=n_steps, dt=1e-4)
+    _, exact = sdof.state_transition(**args)
+
+    print('%d steps, differences against state_transition' % n_steps)
+    for name, func in (('euler', sdof.euler), ('rk4', sdof.rk4),
+                       ('state_transition', sdof.state_transition)):
+        t0 = time.perf_counter()
+        _, x = func(**args)
+        seconds = time.perf_counter() - t0
+        print('%-18s %8.3f s   max difference %8.1e'
+              % (name, seconds, abs(x - exact).max()))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
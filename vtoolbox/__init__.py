@@ -19,8 +19,36 @@ all toolbox functions in the name space
 
 `import vtoolbox.sdof as sdof` will tuck the sdoc functions in the `sdof` box. 
 
+The submodules are only imported when one of their names is first used,
+so `import vtoolbox` itself is quick and needs no plotting packages.
 """
-from .sdof import *
-from .mdof import *
-from .ema import *
+import importlib
+
+_submodules = ('sdof', 'mdof', 'ema', 'fem')
+
+
+def _public(module):
+    return [name for name in vars(module) if not name.startswith('_')]
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module('.' + name, __name__)
+    if name == '__all__':
+        names = []
+        for sub in _submodules:
+            names.extend(_public(importlib.import_module('.' + sub, __name__)))
+        return list(dict.fromkeys(names))
+    if not name.startswith('_'):
+        for sub in _submodules:
+            module = importlib.import_module('.' + sub, __name__)
+            if name in vars(module):
+                value = getattr(module, name)
+                globals()[name] = value
+                return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__getattr__('__all__')))
 
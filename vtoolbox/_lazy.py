@@ -0,0 +1,60 @@
+"""
+Deferred imports for the plotting and notebook dependencies.
+
+matplotlib, IPython and ipywidgets are only imported when a plotting or
+interactive function first needs them, so the numerical functions of the
+toolbox work with nothing but NumPy and SciPy installed.
+"""
+import importlib
+
+
+class LazyModule(object):
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Parameters
+    ----------
+    name: str
+        Full name of the module, e.g. 'matplotlib.pyplot'
+    setup: callable, optional
+        Called once with the module right after it is imported
+
+    Examples:
+    >>> m = LazyModule('json')
+    >>> m.dumps([1, 2])
+    '[1, 2]'
+    """
+
+    def __init__(self, name, setup=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_setup'] = setup
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self._name)
+            if self._setup is not None:
+                self._setup(module)
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        if self.__dict__['_module'] is None:
+            return "<lazy module '%s' (not loaded)>" % self._name
+        return repr(self.__dict__['_module'])
+
+
+def plot_style(plt):
+    """Toolbox figure defaults, applied when pyplot is first used."""
+    plt.rcParams['lines.linewidth'] = 2
+    plt.rcParams['figure.figsize'] = (10, 6)
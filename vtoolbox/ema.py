@@ -1,5 +1,60 @@
-import scipy as sp
-import matplotlib.pyplot as plt
+import os
+
+import numpy as np
+import scipy.io as sio
+import scipy.signal as signal
+
+try:
+    from ._lazy import LazyModule, plot_style
+except ImportError:  # run as a script, python ema.py
+    from _lazy import LazyModule, plot_style
+
+plt = LazyModule('matplotlib.pyplot', setup=plot_style)
+
+
+def frf_data(x, f, dt):
+    """
+    This function will return the frequency response function
+    (H(iw)) of the sampled data, without plotting. See `frf`.
+
+    Examples:
+    >>> import scipy.io as sio
+    >>> data = sio.loadmat('data/frf_data1')
+    >>> x = data['x'].ravel()
+    >>> f = data['f'].ravel()
+    >>> dt = data['dt'].item()
+    >>> freq, mag, ang, coh = frf_data(x, f, dt)
+    >>> print(round(mag[10], 8))
+    1.01839485
+    """
+
+    w = np.sin(np.pi*np.arange(len(f))/len(f))**2 # window
+    # apply window
+    xw = x*w
+    fw = f*w
+    # take ffts
+    FX = np.fft.fft(xw)
+    FF = np.fft.fft(fw)
+    # calculate the spectral densities
+    SXF = FF*np.conj(FX)
+    SXX = FX*np.conj(FX)
+    SFF = FF*np.conj(FF)
+    SFX = FX*np.conj(FF)
+    # calculate the transfer functions
+    TXF = SXX/SXF
+    TXF2 = SFX/SFF
+
+    lt = len(TXF)//2
+    freq = np.arange(lt)/(2*lt*dt)
+
+    TXF = TXF[:lt]
+    mag = np.absolute(TXF)
+    ang = np.angle(TXF)*180/np.pi
+
+    coh = (np.absolute(SXF)**2)/(SXX*SFF)
+    coh = np.real(coh)
+
+    return freq, mag, ang, coh
 
 
 def frf(x, f, dt):
@@ -40,39 +95,15 @@ def frf(x, f, dt):
     >>> x = x.reshape(len(x))
     >>> f = data['f']
     >>> f = f.reshape(len(f))
-    >>> dt = data['dt']
-    >>> dt = float(dt)
+    >>> dt = data['dt'].item()
     >>> # Now we are able to call the function
     >>> freq, mag, ang, coh = frf(x, f, dt)
-    >>> mag[10]
-    1.0183948530809073
+    >>> print(mag[10])
+    1.018394853080907
     """
 
-    w = sp.sin(sp.pi*sp.arange(len(f))/len(f))**2 # window
-    # apply window
-    xw = x*w
-    fw = f*w
-    # take ffts
-    FX = sp.fft(xw)
-    FF = sp.fft(fw)
-    # calculate the spectral densities
-    SXF = FF*sp.conj(FX)
-    SXX = FX*sp.conj(FX)
-    SFF = FF*sp.conj(FF)
-    SFX = FX*sp.conj(FF)
-    # calculate the transfer functions
-    TXF = SXX/SXF
-    TXF2 = SFX/SFF
-
-    lt = len(TXF)//2
-    freq = sp.arange(lt)/(2*lt*dt)
-
-    TXF = TXF[:lt]
-    mag = sp.absolute(TXF)
-    ang = sp.angle(TXF)*180/sp.pi
-
-    coh = (sp.absolute(SXF)**2)/(SXX*SFF)
-    coh = sp.real(coh)
+    freq, mag, ang, coh = frf_data(x, f, dt)
+    lt = len(freq)
 
     # plot H(w)
     fig = plt.figure(figsize=(8,6))
@@ -96,6 +127,307 @@ def frf(x, f, dt):
     return freq, mag, ang, coh
 
 
+def _segment_ffts(signals, nperseg, noverlap, window):
+    """
+    Yields, a block of segments at a time, the windowed real ffts of
+    overlapping segments of each signal. Time runs along the first axis
+    of the signals; each yielded array has shape
+    (n_segments_in_block, ..., nperseg//2 + 1).
+
+    The segments are strided views of the signals, so only the current
+    block is ever copied.
+    """
+    signals = [np.asarray(a) for a in signals]
+    if noverlap is None:
+        noverlap = nperseg // 2
+    step = nperseg - noverlap
+
+    if isinstance(window, np.ndarray):
+        w = window
+    else:
+        w = signal.get_window(window, nperseg)
+
+    # (n_segments, ..., nperseg) views into the records, nothing is copied
+    views = [np.lib.stride_tricks.sliding_window_view(a, nperseg, axis=0)[::step]
+             for a in signals]
+
+    width = sum(int(np.prod(a.shape[1:])) for a in signals)
+    block = max(1, 2**20 // (nperseg * width))
+    for i in range(0, len(views[0]), block):
+        yield [np.fft.rfft(v[i:i + block] * w, axis=-1) for v in views]
+
+
+def frf_welch(x, f, dt, nperseg=1024, noverlap=None, window='hann'):
+    """
+    This function will return the H1 and H2 estimates of the frequency
+    response function and the coherence, averaged over overlapping
+    segments of the record (Welch's method).
+
+    The segments are strided views of x and f, and they are windowed
+    and transformed a block at a time, so memory use depends on nperseg
+    and not on the length of the record. x and f can be memory mapped.
+
+    Parameters
+    ----------
+    x: array
+        Array with the displacement data
+    f: array
+        Array with the force data
+    dt: float
+        Time step of the sampled data
+    nperseg: int
+        Number of points in each segment (and in each fft)
+    noverlap: int, optional
+        Number of points shared by neighbouring segments. Default is
+        None, half a segment.
+    window: str, tuple or array
+        Window applied to each segment, anything accepted by
+        `scipy.signal.get_window`, or an array of length nperseg.
+
+    Returns
+    ----------
+    freq: array
+        Frequencies (Hz)
+    H1: array
+        Sfx/Sff, the estimate that is unbiased by noise on x
+    H2: array
+        Sxx/Sxf, the estimate that is unbiased by noise on f
+    coh: array
+        Coherence function, |Sfx|**2/(Sff*Sxx)
+
+    Examples:
+    >>> import scipy.io as sio
+    >>> data = sio.loadmat('data/frf_data1')
+    >>> x = data['x'].ravel()
+    >>> f = data['f'].ravel()
+    >>> dt = data['dt'].item()
+    >>> freq, H1, H2, coh = frf_welch(x, f, dt, nperseg=256)
+    >>> H1.shape
+    (129,)
+    >>> print(bool(coh.max() <= 1))
+    True
+    """
+    Sff = np.zeros(nperseg//2 + 1)
+    Sxx = np.zeros(nperseg//2 + 1)
+    Sfx = np.zeros(nperseg//2 + 1, complex)
+
+    for FX, FF in _segment_ffts((x, f), nperseg, noverlap, window):
+        Sff += np.sum(FF.real**2 + FF.imag**2, axis=0)
+        Sxx += np.sum(FX.real**2 + FX.imag**2, axis=0)
+        Sfx += np.sum(np.conj(FF) * FX, axis=0)
+
+    H1 = Sfx/Sff
+    H2 = Sxx/np.conj(Sfx)
+    coh = np.abs(Sfx)**2/(Sff*Sxx)
+    freq = np.fft.rfftfreq(nperseg, dt)
+
+    return freq, H1, H2, coh
+
+
+def frf_mimo(x, f, dt, nperseg=1024, noverlap=None, window='hann'):
+    """
+    This function will return the H1 frequency response function
+    matrix between all the force (reference) channels and all the
+    response channels, and the multiple coherence of each response.
+
+    Every channel is transformed once per segment and the spectral
+    matrices are built for all channels and frequencies at once, then
+    H is solved at every frequency in a single batched solve. Segments
+    are averaged as in `frf_welch`.
+
+    Parameters
+    ----------
+    x: array
+        Response data, (n_samples, n_outputs)
+    f: array
+        Force data, (n_samples, n_inputs)
+    dt: float
+        Time step of the sampled data
+    nperseg: int
+        Number of points in each segment (and in each fft)
+    noverlap: int, optional
+        Number of points shared by neighbouring segments. Default is
+        None, half a segment.
+    window: str, tuple or array
+        Window applied to each segment, see `frf_welch`.
+
+    Returns
+    ----------
+    freq: array
+        Frequencies (Hz)
+    H: array
+        H1 estimate, (n_freq, n_outputs, n_inputs), so that
+        X = H @ F at each frequency.
+    coh: array
+        Multiple coherence of each output with all the inputs,
+        (n_freq, n_outputs)
+
+    Examples:
+    >>> import scipy.io as sio
+    >>> data = sio.loadmat('data/frf_data1')
+    >>> x = data['x'].ravel()
+    >>> f = data['f'].ravel()
+    >>> dt = data['dt'].item()
+    >>> freq, H, coh = frf_mimo(np.column_stack([x, 2*x]), f[:, None], dt,
+    ...                         nperseg=256)
+    >>> H.shape
+    (129, 2, 1)
+    >>> _, H1, _, _ = frf_welch(x, f, dt, nperseg=256)
+    >>> print(np.allclose(H[:, 1, 0], 2*H1))
+    True
+    """
+    x = np.asarray(x)
+    f = np.asarray(f)
+    if x.ndim == 1:
+        x = x[:, None]
+    if f.ndim == 1:
+        f = f[:, None]
+    n_freq = nperseg//2 + 1
+    n_in = f.shape[1]
+    n_out = x.shape[1]
+
+    Gff = np.zeros((n_freq, n_in, n_in), complex)
+    Gfx = np.zeros((n_freq, n_in, n_out), complex)
+    Gxx = np.zeros((n_freq, n_out))
+
+    for FX, FF in _segment_ffts((x, f), nperseg, noverlap, window):
+        # FX is (segments, outputs, freq) and FF (segments, inputs, freq)
+        FFc = np.conj(FF)
+        Gff += np.einsum('sif,sjf->fij', FFc, FF)
+        Gfx += np.einsum('sif,sof->fio', FFc, FX)
+        Gxx += np.sum(FX.real**2 + FX.imag**2, axis=0).T
+
+    # H1: Gff @ H.T = Gfx at every frequency
+    HT = np.linalg.solve(Gff, Gfx)
+    H = np.swapaxes(HT, 1, 2)
+    coh = np.real(np.sum(np.conj(Gfx) * HT, axis=1))/Gxx
+    freq = np.fft.rfftfreq(nperseg, dt)
+
+    return freq, H, coh
+
+
+def load_npy(filename):
+    """
+    This function opens a .npy record memory mapped (read only), so
+    only the parts that are used are read from disk.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the .npy file
+
+    Returns
+    ----------
+    data: memmap
+        The record, with the shape and dtype stored in the file
+
+    Examples:
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'record.npy')
+    >>> np.save(filename, np.arange(12.).reshape(6, 2))
+    >>> data = load_npy(filename)
+    >>> data.shape
+    (6, 2)
+    """
+    return np.load(filename, mmap_mode='r')
+
+
+def load_raw(filename, dtype='<f8', n_channels=1, offset=0):
+    """
+    This function opens a headerless or fixed header binary record
+    memory mapped (read only). Samples are stored one after the other,
+    with the channels of each sample interleaved.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the binary file
+    dtype: str or dtype
+        Type of each value, little-endian 8 byte floats by default.
+    n_channels: int
+        Number of interleaved channels
+    offset: int
+        Size of the header in bytes, skipped at the start of the file
+
+    Returns
+    ----------
+    data: memmap
+        The record, (n_samples, n_channels)
+
+    Examples:
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'record.bin')
+    >>> with open(filename, 'wb') as file:
+    ...     _ = file.write(b'header')
+    ...     _ = file.write(np.arange(12, dtype='<f4').tobytes())
+    >>> data = load_raw(filename, '<f4', n_channels=3, offset=6)
+    >>> print(data[1])
+    [3. 4. 5.]
+    """
+    dtype = np.dtype(dtype)
+    n_samples = (os.path.getsize(filename) - offset) // (dtype.itemsize*n_channels)
+
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset,
+                     shape=(n_samples, n_channels))
+
+
+def load_mat(filename, names=None):
+    """
+    This function loads the variables of a .mat file. Version 7.3 files
+    (HDF5) are memory mapped when the variables are stored contiguous
+    and uncompressed, so opening them does not read the data. Older
+    versions are read with `scipy.io.loadmat`.
+    Reading version 7.3 files needs the h5py package.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the .mat file
+    names: list, optional
+        Names of the variables to load. Default is None, all of them.
+
+    Returns
+    ----------
+    data: dict
+        Variable name -> array, with the same (MATLAB) shapes as
+        `scipy.io.loadmat` gives.
+
+    Examples:
+    >>> data = load_mat('data/frf_data1')
+    >>> data['x'].shape
+    (1024, 1)
+    """
+    if not os.path.splitext(filename)[1]:
+        filename = filename + '.mat'
+
+    # version 7.3 files are HDF5 files with a 512 byte MATLAB header
+    with open(filename, 'rb') as file:
+        file.seek(512)
+        hdf5 = file.read(8) == b'\x89HDF\r\n\x1a\n'
+
+    if not hdf5:
+        data = sio.loadmat(filename, variable_names=names)
+        return {k: v for k, v in data.items() if not k.startswith('__')}
+
+    import h5py
+
+    data = {}
+    with h5py.File(filename, 'r') as file:
+        for name, ds in file.items():
+            if not isinstance(ds, h5py.Dataset) or (names is not None and
+                                                    name not in names):
+                continue
+            offset = ds.id.get_offset()
+            if ds.chunks is None and ds.compression is None and offset is not None:
+                data[name] = np.memmap(filename, dtype=ds.dtype, mode='r',
+                                       offset=offset, shape=ds.shape).T
+            else:
+                data[name] = ds[()].T
+            # MATLAB writes column major, so the transpose restores its shape
+
+    return data
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod(optionflags=doctest.ELLIPSIS)
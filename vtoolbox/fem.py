@@ -0,0 +1,482 @@
+"""
+Two dimensional Timoshenko beam and truss finite elements (vtb8_2).
+
+Models are given with the arrays of the Engineering Vibration Toolbox:
+
+node = [[x1, y1], [x2, y2], ...]
+ncon = [[node1, node2, E, A, I, G, Rho], ...]
+zero = [[node, dof], ...]
+force = [[node, dof, force], ...]
+conm = [[node, mass, rotational inertia], ...]
+
+Node numbers count from 1 and dof 1, 2, 3 are x, y and theta, so the
+arrays of the MATLAB .con files can be used unchanged. Rho is the density
+per unit length; set G = 0 to ignore shear deformation and I = 0 for
+pure truss members (then zero all rotations).
+"""
+import hashlib
+import os
+
+import numpy as np
+import scipy.sparse as sparse
+import scipy.sparse.linalg as spla
+
+try:
+    from . import mdof
+    from .ema import load_mat
+except ImportError:  # run as a script, python fem.py
+    import mdof
+    from ema import load_mat
+
+
+def element_matrices(node, ncon):
+    """
+    This function will return the global-coordinate stiffness and mass
+    matrices of all elements, computed in one vectorized pass.
+
+    Parameters
+    ----------
+    node: array
+        Node coordinates, (n_nodes, 2)
+    ncon: array
+        Element connectivity and properties, (n_elements, 7)
+
+    Returns
+    ----------
+    ke: array
+        Element stiffness matrices, (n_elements, 6, 6)
+    me: array
+        Element mass matrices, (n_elements, 6, 6)
+
+    Examples:
+    >>> node = [[0, 0], [1, 0]]
+    >>> ncon = [[1, 2, 1.0, 1.0, 1.0, 0, 1.0]]
+    >>> ke, me = element_matrices(node, ncon)
+    >>> print(ke[0, 1, 1], ke[0, 2, 2], round(me[0, 0, 0] * 420, 10))
+    12.0 4.0 140.0
+    """
+    node = np.asarray(node, dtype=float)
+    ncon = np.asarray(ncon, dtype=float)
+    n1 = ncon[:, 0].astype(int) - 1
+    n2 = ncon[:, 1].astype(int) - 1
+    E, A, I, G, Rho = ncon[:, 2:7].T
+    I = np.where(I == 0, 1e-8 * A, I)
+
+    dx, dy = (node[n2] - node[n1]).T
+    le = np.hypot(dx, dy)
+    theta = np.arctan2(dy, dx)
+    s = np.sin(theta)
+    c = np.cos(theta)
+    R = A * le ** 2 / I
+    # alpha is the ratio of the maximum to the average shear stress,
+    # 3/2 for a rectangular cross section.
+    alpha = 1.5
+    S = G * A * le ** 2 / 12 / E / I / alpha
+    # 1/S, zero for Euler-Bernoulli elements (no shear stiffness)
+    iS = np.divide(1, S, out=np.zeros_like(S), where=S >= 1e-10)
+    q = 1 / (1 + iS)
+
+    ke = np.zeros((len(ncon), 6, 6))
+    ke[:, 0, 0] = R * c ** 2 + 12 * q * s ** 2
+    ke[:, 0, 1] = c * s * (R - 12 * q)
+    ke[:, 1, 1] = R * s ** 2 + 12 * q * c ** 2
+    ke[:, 0, 2] = -6 * le * s * q
+    ke[:, 1, 2] = 6 * le * c * q
+    ke[:, 2, 2] = 4 * le ** 2 * (1 + iS / 4) * q
+    ke[:, 2, 5] = 2 * le ** 2 * (1 - iS / 2) * q
+    ke[:, 0, 3] = -ke[:, 0, 0]
+    ke[:, 0, 4] = -ke[:, 0, 1]
+    ke[:, 0, 5] = ke[:, 0, 2]
+    ke[:, 1, 3] = -ke[:, 0, 1]
+    ke[:, 1, 4] = -ke[:, 1, 1]
+    ke[:, 1, 5] = ke[:, 1, 2]
+    ke[:, 2, 3] = -ke[:, 0, 2]
+    ke[:, 2, 4] = -ke[:, 1, 2]
+    ke[:, 3, 3:5] = ke[:, 0, 0:2]
+    ke[:, 3, 5] = -ke[:, 0, 2]
+    ke[:, 4, 4] = ke[:, 1, 1]
+    ke[:, 4, 5] = -ke[:, 1, 5]
+    ke[:, 5, 5] = ke[:, 2, 2]
+    ke *= (E * I / le ** 3)[:, None, None]
+
+    me = np.zeros((len(ncon), 6, 6))
+    me[:, 0, 0] = 140 * c ** 2 + 156 * s ** 2
+    me[:, 0, 1] = -16 * c * s
+    me[:, 0, 2] = -22 * le * s
+    me[:, 0, 3] = 70 * c ** 2 + 54 * s ** 2
+    me[:, 0, 4] = 16 * c * s
+    me[:, 0, 5] = 13 * le * s
+    me[:, 1, 1] = 140 * s ** 2 + 156 * c ** 2
+    me[:, 1, 2] = 22 * le * c
+    me[:, 1, 3] = me[:, 0, 4]
+    me[:, 1, 4] = 70 * s ** 2 + 54 * c ** 2
+    me[:, 1, 5] = -13 * le * c
+    me[:, 2, 2] = 4 * le ** 2
+    me[:, 2, 3] = -me[:, 0, 5]
+    me[:, 2, 4] = -me[:, 1, 5]
+    me[:, 2, 5] = -3 * le ** 2
+    me[:, 3, 3] = me[:, 0, 0]
+    me[:, 3, 4] = me[:, 0, 1]
+    me[:, 3, 5] = -me[:, 0, 2]
+    me[:, 4, 4] = me[:, 1, 1]
+    me[:, 4, 5] = -me[:, 1, 2]
+    me[:, 5, 5] = me[:, 2, 2]
+    me *= (Rho * le / 420)[:, None, None]
+
+    # only the upper triangles were filled in
+    diag = np.arange(6)
+    for a in (ke, me):
+        a += np.swapaxes(a, 1, 2)
+        a[:, diag, diag] /= 2
+    return ke, me
+
+
+def assemble(node, ncon, conm=None):
+    """
+    This function will return the global stiffness and mass matrices of
+    the model as scipy.sparse CSR matrices. The element matrices are
+    scattered as one COO matrix, so assembly is O(nnz).
+
+    Parameters
+    ----------
+    node: array
+        Node coordinates, (n_nodes, 2)
+    ncon: array
+        Element connectivity and properties, (n_elements, 7)
+    conm: array, optional
+        Concentrated masses [node, mass, rotational inertia]
+
+    Returns
+    ----------
+    K: sparse matrix
+        Stiffness matrix, (3*n_nodes, 3*n_nodes)
+    M: sparse matrix
+        Mass matrix, (3*n_nodes, 3*n_nodes)
+
+    Examples:
+    >>> node = [[0, 0], [0.5, 0], [1, 0]]
+    >>> ncon = [[1, 2, 1, 1, 1, 0, 1], [2, 3, 1, 1, 1, 0, 1]]
+    >>> K, M = assemble(node, ncon, conm=[[3, 2.0]])
+    >>> K.shape
+    (9, 9)
+    >>> print(round(M[0::3, 0::3].sum(), 10))
+    3.0
+    """
+    ncon = np.asarray(ncon, dtype=float)
+    n = 3 * len(node)
+    ke, me = element_matrices(node, ncon)
+
+    first = 3 * (ncon[:, :2].astype(int) - 1)
+    dofs = (first[:, :, None] + np.arange(3)).reshape(-1, 6)
+    rows = np.broadcast_to(dofs[:, :, None], ke.shape).ravel()
+    cols = np.broadcast_to(dofs[:, None, :], ke.shape).ravel()
+    K = sparse.coo_matrix((ke.ravel(), (rows, cols)), shape=(n, n)).tocsr()
+
+    mdata, mrows = [me.ravel()], [rows]
+    mcols = [cols]
+    if conm is not None and np.size(conm) != 0:
+        conm = np.atleast_2d(np.asarray(conm, dtype=float))
+        if conm.shape[1] == 2:
+            conm = np.column_stack((conm, np.zeros(len(conm))))
+        loc = (3 * (conm[:, :1].astype(int) - 1) + np.arange(3)).ravel()
+        mdata.append(conm[:, [1, 1, 2]].ravel())
+        mrows.append(loc)
+        mcols.append(loc)
+    M = sparse.coo_matrix((np.concatenate(mdata), (np.concatenate(mrows),
+                          np.concatenate(mcols))), shape=(n, n)).tocsr()
+    return K, M
+
+
+def free_dofs(n_nodes, zero=None):
+    """
+    Returns the (0 based) indices of the degrees of freedom that are not
+    zeroed by the constraints `zero` = [[node, dof], ...].
+
+    Examples:
+    >>> free_dofs(3, [[1, 1], [1, 2], [3, 2]])
+    array([2, 3, 4, 5, 6, 8])
+    """
+    p = np.ones(3 * n_nodes, dtype=bool)
+    if zero is not None and np.size(zero) != 0:
+        zero = np.atleast_2d(np.asarray(zero)).astype(int)
+        p[3 * (zero[:, 0] - 1) + zero[:, 1] - 1] = False
+    return np.flatnonzero(p)
+
+
+def constrain(K, M, n_nodes, zero=None):
+    """
+    This function will apply the boundary conditions by eliminating the
+    zeroed degrees of freedom from K and M (index selection, no dense row
+    deletion).
+
+    Returns
+    ----------
+    K1: sparse matrix
+        Constrained stiffness matrix
+    M1: sparse matrix
+        Constrained mass matrix
+    p: array
+        Indices of the remaining degrees of freedom in K and M
+    """
+    p = free_dofs(n_nodes, zero)
+    K = sparse.csr_matrix(K)
+    M = sparse.csr_matrix(M)
+    return K[p][:, p], M[p][:, p], p
+
+
+def fe_modes(node, ncon, zero=None, conm=None, n_modes=None, sigma=0):
+    """
+    This function will return the natural frequencies and mass normalized
+    mode shapes of the finite element model (the dynamic analysis of
+    vtb8_2).
+
+    The constrained sparse matrices go straight to
+    `mdof.modes_system_undamped`. With n_modes the lowest modes are found
+    with the sparse shift-invert solver, which is what large models need;
+    without it the full dense problem is solved.
+
+    Parameters
+    ----------
+    node, ncon, zero, conm: array
+        Model definition, see the module docstring
+    n_modes: int, optional
+        Number of modes to compute
+    sigma: float, optional
+        Shift passed to `mdof.modes_system_undamped`
+
+    Returns
+    ----------
+    w: array
+        Natural frequencies (rad/s)
+    X: array
+        Mode shapes, (3*n_nodes, n_modes), zero at constrained dofs
+
+    Examples:
+    >>> node = [[0, 0], [0.5, 0], [1, 0]]
+    >>> ncon = [[1, 2, 1, 100, 1, 0, 1], [2, 3, 1, 100, 1, 0, 1]]
+    >>> w, X = fe_modes(node, ncon, zero=[[1, 1], [1, 2], [1, 3]])
+    >>> print(round(w[0], 4))
+    3.5177
+    """
+    K, M = assemble(node, ncon, conm)
+    return _modes(K, M, free_dofs(len(node), zero), n_modes, sigma)
+
+
+def _modes(K, M, p, n_modes, sigma):
+    """fe_modes for assembled K and M and free dofs p."""
+    K1, M1 = K[p][:, p], M[p][:, p]
+    if n_modes is None or n_modes >= len(p):
+        w, P, S, Sinv = mdof.modes_system_undamped(M1.toarray(), K1.toarray())
+    else:
+        w, P, S, Sinv = mdof.modes_system_undamped(M1, K1, n_modes, sigma)
+    # rigid body modes can come out of eigen() out of order
+    w = np.real(w)
+    order = np.argsort(w)
+    X = np.zeros((K.shape[0], S.shape[1]))
+    X[p] = np.real(S[:, order])
+    return w[order], X
+
+
+def fe_static(node, ncon, zero, force, conm=None):
+    """
+    This function will return the static displacements and the nodal
+    forces (loads and reactions) of the finite element model (the static
+    analysis of vtb8_2).
+
+    Returns
+    ----------
+    x: array
+        Displacements [x, y, theta] of each node, (n_nodes, 3)
+    f: array
+        Forces [x, y, moment] at each node, (n_nodes, 3)
+
+    Examples:
+    >>> node = [[0, 0], [1, 0]]
+    >>> ncon = [[1, 2, 1.0, 1.0, 1.0, 0, 1.0]]
+    >>> x, f = fe_static(node, ncon, [[1, 1], [1, 2], [1, 3]], [[2, 2, 1.0]])
+    >>> print(round(x[1, 1], 6))
+    0.333333
+    """
+    K, M = assemble(node, ncon, conm)
+    return _static(K, free_dofs(len(node), zero), force)
+
+
+def _static(K, p, force):
+    """fe_static for an assembled K and free dofs p."""
+    force = np.atleast_2d(np.asarray(force, dtype=float))
+    f = np.zeros(K.shape[0])
+    f[3 * (force[:, 0].astype(int) - 1) + force[:, 1].astype(int) - 1] = force[:, 2]
+    x = np.zeros(K.shape[0])
+    x[p] = spla.spsolve(K[p][:, p].tocsc(), f[p])
+    f = K @ x
+    return x.reshape(-1, 3), f.reshape(-1, 3)
+
+
+class Model(object):
+    """
+    Finite element model: the vtb8 definition arrays and the assembled
+    sparse matrices. Usually made by `load_model`.
+
+    Attributes
+    ----------
+    node, ncon, zero, force, conm: array
+        Model definition, see the module docstring. Empty arrays when a
+        file did not define them.
+    K, M: sparse matrix
+        Stiffness and mass matrices of all 3*n_nodes dofs
+    p: array
+        Indices of the unconstrained dofs
+    """
+
+    def __init__(self, node, ncon, zero=None, force=None, conm=None,
+                 K=None, M=None):
+        self.node = _table(node, 2)
+        self.ncon = _table(ncon, 7)
+        self.zero = _table(zero, 2)
+        self.force = _table(force, 3)
+        self.conm = _table(conm, 3)
+        if K is None or M is None:
+            K, M = assemble(self.node, self.ncon, self.conm)
+        self.K = K
+        self.M = M
+        self.p = free_dofs(len(self.node), self.zero)
+
+    @property
+    def K1(self):
+        """Constrained stiffness matrix."""
+        return self.K[self.p][:, self.p]
+
+    @property
+    def M1(self):
+        """Constrained mass matrix."""
+        return self.M[self.p][:, self.p]
+
+    def modes(self, n_modes=None, sigma=0):
+        """Natural frequencies and mode shapes, see `fe_modes`."""
+        return _modes(self.K, self.M, self.p, n_modes, sigma)
+
+    def static(self, force=None):
+        """Static displacements and forces, see `fe_static`."""
+        return _static(self.K, self.p, self.force if force is None else force)
+
+    def __repr__(self):
+        return '<Model: %d nodes, %d elements, %d free dofs>' % (
+            len(self.node), len(self.ncon), len(self.p))
+
+
+def _table(a, width):
+    """(n, width) float array; MATLAB's [] (0x0) becomes (0, width)."""
+    if a is None or np.size(a) == 0:
+        return np.zeros((0, width))
+    a = np.atleast_2d(np.asarray(a, dtype=float))
+    if a.shape[1] < width:
+        # e.g. conm without rotational inertias
+        a = np.column_stack((a, np.zeros((len(a), width - a.shape[1]))))
+    return a
+
+
+def load_model(filename, cache=True):
+    """
+    This function reads a vtb8 model file (.con, MAT-format) into a
+    `Model`.
+
+    The assembled K and M are cached in `filename + '.npz'` next to the
+    source file, keyed by a hash of its contents, so opening the model
+    again skips the assembly. A directory that cannot be written to only
+    means no cache.
+
+    Parameters
+    ----------
+    filename: str
+        Path to the .con file, the extension may be omitted
+    cache: bool, optional
+        Read and write the cache file. Default is True.
+
+    Returns
+    ----------
+    model: Model
+        The model
+
+    Examples:
+    >>> model = load_model('../Matlab_files/vtb8_e1', cache=False)
+    >>> model
+    <Model: 6 nodes, 5 elements, 15 free dofs>
+    >>> w, X = model.modes()
+    >>> print(np.round(w[:3], 4))
+    [ 162.2538 1017.3215 2521.4303]
+    """
+    if not os.path.exists(filename) and os.path.exists(filename + '.con'):
+        filename = filename + '.con'
+    with open(filename, 'rb') as fid:
+        digest = hashlib.sha1(fid.read()).hexdigest()
+    data = load_mat(filename)
+    names = ('node', 'ncon', 'zero', 'force', 'conm')
+    args = [data.get(name) for name in names]
+
+    cachefile = filename + '.npz'
+    if cache and os.path.exists(cachefile):
+        with np.load(cachefile) as c:
+            if str(c['digest']) == digest:
+                K, M = [sparse.csr_matrix((c[m + '_data'], c[m + '_indices'],
+                                           c[m + '_indptr']),
+                                          shape=tuple(c['shape']))
+                        for m in ('K', 'M')]
+                return Model(*args, K=K, M=M)
+
+    model = Model(*args)
+    if cache:
+        arrays = dict(digest=digest, shape=model.K.shape)
+        for m, a in (('K', model.K), ('M', model.M)):
+            arrays.update({m + '_data': a.data, m + '_indices': a.indices,
+                           m + '_indptr': a.indptr})
+        # written under another name first, readers never see half a file
+        tmp = '%s.%d.tmp' % (cachefile, os.getpid())
+        try:
+            with open(tmp, 'wb') as fid:
+                np.savez(fid, **arrays)
+            os.replace(tmp, cachefile)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return model
+
+
+def load_eqn(filename):
+    """
+    This function reads the constrained matrices that vtb8_2 saves in a
+    .eqn file.
+
+    Returns
+    ----------
+    K1: sparse matrix
+        Constrained stiffness matrix
+    M1: sparse matrix
+        Constrained mass matrix
+    p: array
+        0 based indices of the unconstrained dofs, as `free_dofs`
+
+    Examples:
+    >>> K1, M1, p = load_eqn('../Matlab_files/truss2.eqn')
+    >>> model = load_model('../Matlab_files/truss2', cache=False)
+    >>> bool(np.array_equal(p, model.p) and np.allclose(K1.toarray(), model.K1.toarray()))
+    True
+    """
+    data = load_mat(filename, ['k1', 'm1', 'p'])
+    p = np.asarray(data['p'], dtype=float).ravel().astype(int) - 1
+    return (sparse.csr_matrix(np.asarray(data['k1'], dtype=float)),
+            sparse.csr_matrix(np.asarray(data['m1'], dtype=float)), p)
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod(optionflags=doctest.ELLIPSIS)
+    """ What this does.
+    python (name of this file)  -v
+    will test all of the examples in the help.
+
+    Leaving off -v will run the tests without any output. Success will return nothing.
+
+    See the doctest section of the python manual.
+    https://docs.python.org/3.5/library/doctest.html
+    """
@@ -1,10 +1,163 @@
+import functools
+import hashlib
+import inspect
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import scipy as sp
 import scipy.linalg as la
+import scipy.optimize as optimize
 import scipy.signal as signal
-import matplotlib as mpl
+import scipy.sparse as sparse
+import scipy.sparse.linalg as spla
+
+try:
+    from ._filter import _sdof_filter
+except ImportError:  # run as a script, python mdof.py
+    from _filter import _sdof_filter
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_cache = OrderedDict()
+_cache_stats = {'hits': 0, 'misses': 0, 'maxsize': 0}
+
+
+def modal_cache(maxsize=32):
+    """
+    Turns on memoization of the modal decompositions and state space
+    matrices computed by `modes_system`, `modes_system_undamped` and the
+    response functions. Results are keyed on a hash of the contents of
+    the matrices, so calling again with equal (M, K, C) skips the
+    eigenvalue problem. The least recently used entries are dropped
+    once there are more than maxsize.
 
-mpl.rcParams['lines.linewidth'] = 2
-mpl.rcParams['figure.figsize'] = (10, 6)
+    The cache keeps read-only copies and every call, hit or miss, gets
+    its own writable arrays.
+
+    Parameters
+    ----------
+    maxsize: int
+        Maximum number of cached results. 0 turns the cache off and
+        empties it.
+
+    Examples:
+    >>> modal_cache(8)
+    >>> M = np.array([[1, 0],
+    ...               [0, 1]])
+    >>> K = np.array([[2, -1],
+    ...               [-1, 2]])
+    >>> w, P, S, Sinv = modes_system_undamped(M, K)
+    >>> w, P, S, Sinv = modes_system_undamped(M, K.copy())
+    >>> modal_cache_info()
+    CacheInfo(hits=1, misses=1, maxsize=8, currsize=1)
+    >>> w[0] = 0  # a writable copy, the cached w is unchanged
+    >>> w, P, S, Sinv = modes_system_undamped(M, K, n_modes=None)
+    >>> t, X = response_system_undamped(M, K, [1, 0], [0, 0], 1)
+    >>> modal_cache_info()
+    CacheInfo(hits=2, misses=2, maxsize=8, currsize=2)
+    >>> modal_cache(0)
+    """
+    _cache_stats['maxsize'] = maxsize
+    _trim_cache()
+
+
+def modal_cache_info():
+    """
+    Returns the hits, misses, maxsize and current size of the cache
+    turned on by `modal_cache`.
+    """
+    return CacheInfo(_cache_stats['hits'], _cache_stats['misses'],
+                     _cache_stats['maxsize'], len(_cache))
+
+
+def modal_cache_clear():
+    """
+    Empties the cache turned on by `modal_cache` and resets its
+    statistics.
+    """
+    _cache.clear()
+    _cache_stats['hits'] = 0
+    _cache_stats['misses'] = 0
+
+
+def _trim_cache():
+    while len(_cache) > _cache_stats['maxsize']:
+        _cache.popitem(last=False)
+
+
+def _digest(a):
+    """Key for one argument: arrays and sparse matrices by content."""
+    if sparse.issparse(a):
+        a = sparse.csr_matrix(a, copy=True)
+        a.sum_duplicates()
+        return ('sparse', a.shape, _digest(a.data),
+                _digest(a.indices), _digest(a.indptr))
+    if isinstance(a, (np.ndarray, list, tuple)):
+        a = np.ascontiguousarray(a)
+        return (a.shape, a.dtype.str, hashlib.sha1(a).hexdigest())
+    return a
+
+
+def _frozen(r):
+    """Read-only copy of an array result, for the cache."""
+    if isinstance(r, np.ndarray):
+        r = r.copy()
+        r.setflags(write=False)
+    return r
+
+
+def _memoize(func):
+    """Caches func in the modal cache when it is turned on."""
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _cache_stats['maxsize']:
+            return func(*args, **kwargs)
+
+        # f(M, K, 2), f(M, K, n_modes=2) and f(M, K, 2, None) are one key
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__,
+               tuple((k, _digest(v)) for k, v in bound.arguments.items()))
+        if key in _cache:
+            _cache_stats['hits'] += 1
+            _cache.move_to_end(key)
+            return tuple(r.copy() if isinstance(r, np.ndarray) else r
+                         for r in _cache[key])
+
+        _cache_stats['misses'] += 1
+        result = func(*args, **kwargs)
+        _cache[key] = tuple(_frozen(r) for r in result)
+        _trim_cache()
+        return result
+
+    return wrapper
+
+
+@_memoize
+def _state_space(M, K, C=None):
+    """
+    Returns the state space matrices A and B of
+    M x'' + C x' + K x = f with state [x, x'] and input f.
+    """
+    M = np.asarray(M, dtype=float)
+
+    # works for single matrices and (batch, n, n) stacks
+    Z = np.zeros_like(M)
+    I = np.broadcast_to(np.eye(M.shape[-1]), M.shape)
+
+    Minv = np.linalg.pinv(M)
+    damping = Z if C is None else -Minv @ C
+
+    # creates the state space matrix
+    A = np.block([[Z,         I],
+                  [-Minv @ K, damping]])
+    B = np.block([[Z],
+                  [np.linalg.inv(M)]])
+
+    return A, B
 
 
 def eigen(A, B=None):
@@ -20,17 +173,19 @@ def eigen(A, B=None):
     ----------
     A: array
         A complex or real matrix whose eigenvalues and eigenvectors
-        will be computed.
+        will be computed. A stack of matrices, shape (batch, N, N), is
+        solved and sorted matrix by matrix without a Python loop.
     B: float or str
         Right-hand side matrix in a generalized eigenvalue problem.
         Default is None, identity matrix is assumed.
+        For stacks the problem is solved as B^-1 A.
 
     Returns
     ----------
     evalues: array
-        Sorted eigenvalues
+        Sorted eigenvalues, (N,) or (batch, N)
     evectors: array
-        Sorted eigenvalues
+        Sorted eigenvalues, (N, N) or (batch, N, N)
 
     Examples:
     >>> L = sp.array([[2, -1, 0],
@@ -39,27 +194,48 @@ def eigen(A, B=None):
     >>> lam, P = eigen(L)
     >>> lam
     array([  0.56258062+0.j,   2.63206172+0.j,  10.80535766+0.j])
+    >>> # stacks of matrices, (batch, N, N), are solved together
+    >>> L = np.array([[2., -1, 0],
+    ...               [-4, 8, -4],
+    ...               [0, -4, 4]])
+    >>> lam, P = eigen(np.array([L, 2*L]))
+    >>> print(lam.real)
+    [[ 0.56258062  2.63206172 10.80535766]
+     [ 1.12516124  5.26412344 21.61071532]]
+    >>> lam1, P1 = eigen(2*L)
+    >>> print(np.allclose(lam[1], lam1), np.allclose(P[1], P1))
+    True True
     """
-    if B is None:
+    if np.ndim(A) == 3:
+        # stacks go through numpy's batched eig
+        if B is not None:
+            A = np.linalg.solve(B, A)
+        evalues, evectors = np.linalg.eig(A)
+    elif B is None:
         evalues, evectors = la.eig(A)
     else:
         evalues, evectors = la.eig(A, B)
 
-    if all(eigs == 0 for eigs in evalues.imag):
-        if all(eigs > 0 for eigs in evalues.real):
-            idxp = evalues.real.argsort()  # positive in increasing order
-            idxn = sp.array([], dtype=int)
-        else:
-            idxp = evalues.real.argsort()[int(len(evalues)/2):]  # positive in increasing order
-            idxn = evalues.real.argsort()[int(len(evalues)/2) - 1::-1]  # negative in decreasing order
+    # the ordering is worked out for the whole stack at once, a single
+    # matrix is a stack of one
+    evalues = np.atleast_2d(evalues)
+    half = evalues.shape[-1] // 2
 
-    else:
-        idxp = evalues.imag.argsort()[int(len(evalues)/2):]  # positive in increasing order
-        idxn = evalues.imag.argsort()[int(len(evalues)/2) - 1::-1]  # negative in decreasing order
+    real = np.all(evalues.imag == 0, axis=-1, keepdims=True)
+    positive = real & np.all(evalues.real > 0, axis=-1, keepdims=True)
+    order = np.where(real, evalues.real, evalues.imag).argsort(axis=-1)
 
-    idx = sp.hstack([idxp, idxn])
+    # positive in increasing order, then negative in decreasing order
+    idx = np.concatenate([order[:, half:], order[:, half - 1::-1][:, :half]],
+                         axis=-1)
+    idx = np.where(positive, order, idx)
 
-    return evalues[idx], evectors[:, idx]
+    if np.ndim(A) == 2:
+        idx = idx[0]
+        return evalues[0, idx], evectors[:, idx]
+
+    return (np.take_along_axis(evalues, idx, axis=-1),
+            np.take_along_axis(evectors, idx[:, None, :], axis=-1))
 
 
 def normalize(X, Y):
@@ -101,29 +277,41 @@ def normalize(X, Y):
              0.11289137 +9.08101611e-04j, -0.65854649 +5.87827297e-03j]])
     """
 
-    Yn = sp.zeros_like(X)
-    YTX = Y.T @ X # normalize y so that Y.T @ X will return I
-    factors = [1/a for a in sp.diag(YTX)]
-    # multiply each column in y by a factor in 'factors'
-    for col in enumerate(Y.T):
-        Yn[col[0]] = col[1]*factors[col[0]]
-    Yn = Yn.T
+    # normalize y so that Y.T @ X will return I: divide each column of Y
+    # by the matching diagonal entry of Y.T @ X (also for stacks)
+    Yn = Y / np.einsum('...ij,...ij->...j', Y, X)[..., None, :]
 
     return Yn
 
 
-def modes_system_undamped(M, K):
+@_memoize
+def modes_system_undamped(M, K, n_modes=None, sigma=None):
     """
     This function will return the natural frequencies (w),
     eigenvectors (P), mode shapes (S) abd the modal transformation
     matrix S^-1(takes x -> r(modal coordinates) for an undamped system.
 
+    If n_modes is given, only the n_modes eigenvalues closest to sigma
+    are returned. For sparse M and K, or dense ones of at least
+    _partial_min_size dofs, they are computed with a sparse shift-invert
+    solver (`eigsh`), which is what makes large finite element models
+    tractable. Smaller dense problems are solved in full and truncated.
+
     Parameters
     ----------
-    M: array
+    M: array or sparse matrix
         Mass matrix
-    K: array
+    K: array or sparse matrix
         Stiffness matrix
+    n_modes: int, optional
+        Number of modes to compute. Default is None, all modes of the
+        dense problem are computed. Required for sparse matrices.
+    sigma: float, optional
+        Shift, in the units of the eigenvalues w**2, around which the
+        modes are searched when n_modes is given. Default is a small
+        negative shift, -1e-6 * max(diag(K)) / max(diag(M)), which
+        gives the lowest modes and keeps the shift-invert factorization
+        regular when K is singular (rigid body modes).
 
     Returns
     ----------
@@ -146,13 +334,86 @@ def modes_system_undamped(M, K):
     >>> w, P, S, Sinv = modes_system_undamped(M, K)
     >>> w
     array([ 0.44504187+0.j,  1.24697960+0.j,  1.80193774+0.j])
+    >>> M = sparse.diags([4.]*100)
+    >>> K = sparse.diags([[-4.]*99, [8.]*99 + [4.], [-4.]*99], [-1, 0, 1])
+    >>> w, P, S, Sinv = modes_system_undamped(M, K, n_modes=3)
+    >>> print(w)
+    [0.01562966 0.04688515 0.07812919]
+    >>> # free-free chain, one rigid body mode
+    >>> K = sparse.diags([[-4.]*99, [4.] + [8.]*98 + [4.], [-4.]*99], [-1, 0, 1])
+    >>> w, P, S, Sinv = modes_system_undamped(M, K, n_modes=2)
+    >>> print(np.round(w, 6))
+    [0.       0.031415]
+    >>> w, P, S, Sinv = modes_system_undamped(np.diag([9, 1]),
+    ...                                       np.array([[27, -3], [-3, 3]]), 1)
+    >>> print(np.round(w, 6))
+    [1.414214]
+    >>> w, P, S, Sinv = modes_system_undamped(sparse.diags([4.]*3),
+    ...     sparse.diags([[-4.]*2, [8., 8., 4.], [-4.]*2], [-1, 0, 1]), 3)
+    >>> print(np.round(w, 6))
+    [0.445042 1.24698  1.801938]
     """
-    L = la.cholesky(M)
+    sparse_input = sparse.issparse(M) or sparse.issparse(K)
+    if n_modes is not None and n_modes < M.shape[0] - 1 and (
+            sparse_input or M.shape[0] >= _partial_min_size):
+        return _modes_system_undamped_partial(M, K, n_modes, sigma)
+    if sparse_input:
+        if n_modes is None:
+            raise ValueError('n_modes is needed for sparse M and K')
+        # eigsh finds at most n - 2 modes, the rest are solved in full
+        M = M.toarray() if sparse.issparse(M) else M
+        K = K.toarray() if sparse.issparse(K) else K
+
+    M = np.asarray(M, dtype=float)
+    K = np.asarray(K, dtype=float)
+    L = la.cholesky(M, lower=True)  # M = L @ L.T
     Linv = la.inv(L)
     lam, P = eigen(Linv @ K @ Linv.T)
-    w = sp.real(sp.sqrt(lam))
-    S = Linv @ P
-    Sinv = P.T @ Linv
+    w = np.real(np.sqrt(lam))
+    S = Linv.T @ P
+    Sinv = P.T @ L.T
+
+    if n_modes is not None:
+        lam = np.real(lam)
+        if sigma is None:
+            sigma = -np.inf
+        idx = np.argsort(np.abs(lam - sigma), kind='stable')[:n_modes]
+        idx = idx[np.argsort(lam[idx], kind='stable')]
+        w, P, S, Sinv = w[idx], P[:, idx], S[:, idx], Sinv[idx]
+
+    return w, P, S, Sinv
+
+
+# dense problems smaller than this are solved in full even if n_modes
+# is given: eigsh is slower there and ARPACK can fail on tiny problems
+_partial_min_size = 500
+
+
+def _modes_system_undamped_partial(M, K, n_modes, sigma):
+    """
+    Lowest (closest to sigma) n_modes of K v = w**2 M v by shift-invert
+    Lanczos. Returns the same (w, P, S, Sinv) as modes_system_undamped,
+    restricted to those modes.
+    """
+    M = sparse.csc_matrix(M, dtype=float)
+    K = sparse.csc_matrix(K, dtype=float)
+    if sigma is None:
+        sigma = -1e-6 * abs(K.diagonal()).max() / abs(M.diagonal()).max()
+
+    lam, S = spla.eigsh(K, k=n_modes, M=M, sigma=sigma, which='LM')
+    idx = lam.argsort()
+    lam = lam[idx]
+    S = S[:, idx]  # eigsh returns mass normalized vectors, S.T @ M @ S = I
+
+    w = np.sqrt(np.maximum(lam, 0))
+
+    # P = L.T @ S with M = L @ L.T. An LU without pivoting of the positive
+    # definite M is M = L1 @ U with U = diag(d) @ L1.T, so L.T = U/sqrt(d)
+    lu = spla.splu(M, permc_spec='NATURAL', diag_pivot_thresh=0,
+                   options=dict(SymmetricMode=True))
+    d = lu.U.diagonal()
+    P = (lu.U @ S) / np.sqrt(d)[:, None]
+    Sinv = (M @ S).T
 
     return w, P, S, Sinv
 
@@ -174,6 +435,8 @@ def modes_system(M, K, C=None):
         Stiffness matrix
     C: array
         Damping matrix
+    A stack of systems, (batch, n, n) matrices, is solved in one go.
+    All of them are then treated as non-proportionally damped.
 
     Returns
     ----------
@@ -227,15 +490,45 @@ def modes_system(M, K, C=None):
     >>> X
     array([[-0.99677405,  0.08025891],
            [ 0.08025891, -0.99677405]])
+    >>> # stacks of systems, (batch, n, n), are solved together
+    >>> M = np.eye(2)
+    >>> K = np.array([[1, -0.4],
+    ...               [0.4, 6]])
+    >>> C = np.array([[0.3, -4],
+    ...               [4, 0.2]])
+    >>> wn, wd, zeta, X, Y = modes_system(np.array([M, M]), np.array([K, 2*K]),
+    ...                                   np.array([C, C]))
+    >>> wn.shape, X.shape
+    ((2, 4), (2, 4, 4))
+    >>> wn1, wd1, zeta1, X1, Y1 = modes_system(M, 2*K, C)
+    Damping is non-proportional, eigenvectors are complex.
+    >>> print(np.allclose(wn[1], wn1), np.allclose(X[1], X1),
+    ...       np.allclose(Y[1], Y1))
+    True True True
     """
 
+    wn, wd, zeta, X, Y = _modes_system(M, K, C)
+    if np.ndim(M) == 2:
+        if zeta is None:
+            print('Damping is proportional or zero, eigenvectors are real')
+        else:
+            print('Damping is non-proportional, eigenvectors are complex.')
+    return wn, wd, zeta, X, Y
+
+
+@_memoize
+def _modes_system(M, K, C=None):
+    """Cached core of `modes_system`, without its messages."""
+    if np.ndim(M) == 3:
+        return _modes_system_stack(M, K, C)
+
     n = len(M)
 
-    Z = sp.zeros((n, n))
-    I = sp.eye(n)
+    Z = np.zeros((n, n))
+    I = np.eye(n)
     Minv = la.inv(M)
     
-    if (C is None or sp.all(C == 0) or # check if C has only zero entries
+    if (C is None or np.all(C == 0) or # check if C has only zero entries
         la.norm(Minv @ C @ K - Minv @ K @ C, 2) < 1e-8*la.norm(Minv @ K @ C, 2)):
         w, P, S, Sinv = modes_system_undamped(M, K)
         wn = w
@@ -243,30 +536,183 @@ def modes_system(M, K, C=None):
         zeta = None
         X = P
         Y = P
-        print('Damping is proportional or zero, eigenvectors are real')
         return wn, wd, zeta, X, Y
 
-    Z = sp.zeros((n, n))
-    I = sp.eye(n)
-
-    # creates the state space matrix
-    A = sp.vstack([sp.hstack([Z, I]),
-                   sp.hstack([-la.pinv(M) @ K, -la.pinv(M) @ C])])
+    A, _ = _state_space(M, K, C)
 
     w, X = eigen(A)
     _, Y = eigen(A.T)
 
-    wd = sp.imag(w)
-    wn = sp.absolute(w)
-    zeta = (-sp.real(w)/sp.absolute(w))
+    wd = np.imag(w)
+    wn = np.absolute(w)
+    zeta = (-np.real(w)/np.absolute(w))
 
     Y = normalize(X, Y)
 
-    print('Damping is non-proportional, eigenvectors are complex.')
+    return wn, wd, zeta, X, Y
+
+
+def _modes_system_stack(M, K, C):
+    """
+    modes_system for (batch, n, n) stacks. Every system goes through the
+    state space eigenvalue problem, proportionally damped or not, so
+    all outputs have 2n entries per system and zeta is never None.
+    """
+    A, _ = _state_space(M, K, C)
+
+    w, X = eigen(A)
+    _, Y = eigen(np.swapaxes(A, -1, -2))
+
+    wd = np.imag(w)
+    wn = np.absolute(w)
+    zeta = -np.real(w)/np.absolute(w)
+
+    Y = normalize(X, Y)
 
     return wn, wd, zeta, X, Y
 
 
+def mac(X, Y):
+    """
+    This function returns the Modal Assurance Criterion between each
+    column of X and each column of Y,
+    MAC[i, j] = |X[:, i]^H Y[:, j]|^2 / ((X[:, i]^H X[:, i]) (Y[:, j]^H Y[:, j])).
+    1 means the two vectors are the same mode shape, 0 that they are
+    orthogonal.
+
+    Parameters
+    ----------
+    X, Y: array
+        Real or complex mode shapes, one per column.
+
+    Returns
+    ----------
+    MAC: array
+        Array with shape (X.shape[1], Y.shape[1])
+
+    Examples:
+    >>> X = np.array([[1, 0],
+    ...               [1, 1]])
+    >>> print(mac(X, X))
+    [[1.  0.5]
+     [0.5 1. ]]
+    """
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    XY = np.abs(X.conj().T @ Y)**2
+    XX = np.sum(np.abs(X)**2, axis=0)
+    YY = np.sum(np.abs(Y)**2, axis=0)
+
+    return XY / np.outer(XX, YY)
+
+
+def _campbell_point(system, p):
+    """Modes of system(p) for `campbell`, run in the worker processes."""
+    M, K, C = system(p)
+    n = len(M)
+    A, _ = _state_space(M, K, C)
+    lam, X = eigen(A)
+    # one of each complex conjugate pair, and both real roots of the
+    # overdamped modes
+    real = np.abs(lam.imag) <= 1e-9 * np.abs(lam)
+    idx = np.flatnonzero(real | (lam.imag > 0))
+    idx = idx[np.argsort(np.abs(lam[idx]), kind='stable')]
+    return lam[idx], X[:n, idx]
+
+
+def campbell(system, params, processes=None):
+    """
+    This function computes the natural frequencies and damping ratios
+    of a system over a sweep of a parameter (e.g. rotor speed) and
+    tracks each mode from one parameter value to the next with the
+    Modal Assurance Criterion (`mac`), so that the curves follow the
+    modes through crossings instead of the frequency order. The result
+    is ready for a Campbell diagram (params against wn).
+
+    The eigenvalue problems are spread over a pool of processes.
+
+    Parameters
+    ----------
+    system: callable
+        system(p) returns (M, K, C) for the parameter value p. C may be
+        None. With processes other than 1 it has to be picklable (a
+        module level function).
+    params: array
+        Parameter values, in sweep order.
+    processes: int, optional
+        Number of worker processes. Default is None, one per CPU.
+        1 runs the sweep in this process.
+
+    Returns
+    ----------
+    wn: array
+        Natural frequencies, (len(params), n). Column j is mode j
+        at every parameter value.
+    wd: array
+        The damped natural frequencies, same layout.
+    zeta: array
+        The damping ratios, same layout.
+    MAC: array
+        MAC between each mode and the mode it was paired with at the
+        previous parameter value, (len(params) - 1, n). Low values flag
+        unreliable pairing (sweep too coarse).
+
+    An overdamped mode has two real eigenvalues instead of a complex
+    pair. Both are kept, as two curves with wd = 0, so the arrays have
+    n plus one column per mode that is overdamped somewhere in the
+    sweep. Where such a column has no mode it holds nan.
+
+    Examples:
+    >>> def system(k):
+    ...     M = np.eye(2)
+    ...     K = np.array([[2 + k, 0],
+    ...                   [0,     3]])
+    ...     return M, K, 0.01*K
+    >>> # the first mode crosses the second one at k = 1
+    >>> wn, wd, zeta, MAC = campbell(system, np.linspace(0, 2, 20), 1)
+    >>> print(wn[[0, -1]])
+    [[1.41421356 1.73205081]
+     [2.         1.73205081]]
+    >>> # the first mode becomes overdamped, its two real roots split
+    >>> def system(c):
+    ...     return np.eye(2), np.diag([1., 9.]), np.diag([c, 0.1])
+    >>> wn, wd, zeta, MAC = campbell(system, np.linspace(0.1, 4, 40), 1)
+    >>> print(np.round(wn[-1], 3))
+    [3.732 3.    0.268]
+    """
+    point = functools.partial(_campbell_point, system)
+    if processes == 1:
+        results = list(map(point, params))
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(point, params,
+                                        chunksize=max(1, len(params)//64)))
+
+    # pad to the largest number of modes (overdamped ones count twice)
+    width = max(len(r[0]) for r in results)
+    lam = np.full((len(params), width), np.nan, dtype=complex)
+    X = []
+    for i, (lam_i, X_i) in enumerate(results):
+        lam[i, :len(lam_i)] = lam_i
+        X.append(np.hstack((X_i, np.zeros((len(X_i), width - len(lam_i))))))
+    MAC = np.empty((len(params) - 1, width))
+
+    for i in range(1, len(params)):
+        # pair the modes maximizing the total MAC with the previous point
+        with np.errstate(invalid='ignore'):
+            mac_i = mac(X[i - 1], X[i])
+        rows, cols = optimize.linear_sum_assignment(-np.nan_to_num(mac_i))
+        lam[i] = lam[i, cols]
+        X[i] = X[i][:, cols]
+        MAC[i - 1] = mac_i[rows, cols]
+
+    wn = np.absolute(lam)
+    wd = np.imag(lam)
+    zeta = -np.real(lam)/np.absolute(lam)
+
+    return wn, wd, zeta, MAC
+
+
 def response_system_undamped(M, K, x0, v0, max_time):
     """
     This function calculates the time response for an undamped system
@@ -296,36 +742,31 @@ def response_system_undamped(M, K, x0, v0, max_time):
         The state-space vector for each time
 
     Examples:
-    >>> M = sp.array([[1, 0],
+    >>> M = np.array([[1, 0],
     ...               [0, 4]])
-    >>> K = sp.array([[12, -2],
+    >>> K = np.array([[12, -2],
     ...               [-2, 12]])
-    >>> x0 = sp.array([1, 1])
-    >>> v0 = sp.array([0, 0])
+    >>> x0 = np.array([1, 1])
+    >>> v0 = np.array([0, 0])
     >>> max_time = 10
     >>> t, X = response_system_undamped(M, K, x0, v0, max_time)
     >>> X[:, 0] # first column of X will contain the initial conditions [x1, x2, v1, v2]
-    array([ 1.,  1.,  0.,  0.])
+    array([1., 1., 0., 0.])
     >>> X[:, 1] # displacement and velocities after delta t
     array([ 0.99991994,  0.99997998, -0.04001478, -0.01000397])
     """
 
-    t = sp.linspace(0, max_time, int(250 * max_time))
+    t = np.linspace(0, max_time, int(250 * max_time))
     dt = t[1] - t[0]
 
     n = len(M)
 
-    Z = sp.zeros((n, n))
-    I = sp.eye(n, n)
-
-    # creates the state space matrix
-    A = sp.vstack([sp.hstack([Z,               I]),
-                   sp.hstack([-la.pinv(M) @ K, Z])])
+    A, _ = _state_space(M, K)
 
     # creates the x array and set the first line according to the initial
     # conditions
-    X = sp.zeros((2*n, len(t)))
-    X[:, 0] = sp.hstack([x0, v0])
+    X = np.zeros((2*n, len(t)))
+    X[:, 0] = np.hstack([x0, v0])
 
     Ad = la.expm(A * dt)
     for i in range(len(t) - 1):
@@ -334,6 +775,76 @@ def response_system_undamped(M, K, x0, v0, max_time):
     return t, X
 
 
+def response_system_undamped_modal(M, K, x0, v0, max_time, n_modes=None):
+    """
+    This function calculates the time response for an undamped system
+    by modal superposition and returns the vector (state-space) X, with
+    the same layout as `response_system_undamped`.
+    Each modal coordinate has the closed form solution
+    r(t) = r0*cos(w*t) + rd0/w*sin(w*t), so all time samples are
+    computed at once and no error builds up over long records.
+
+    Parameters
+    ----------
+    M: array
+        Mass matrix
+    K: array
+        Stiffness matrix
+    x0: array
+        Array with displacement initial conditions
+    v0: array
+        Array with velocity initial conditions
+    max_time: float
+        End time
+    n_modes: int, optional
+        Number of modes kept, starting from the lowest natural
+        frequency. Default is None, all modes are used.
+
+    Returns
+    ----------
+    t: array
+        Array with the time
+    X: array
+        The state-space vector for each time
+
+    Examples:
+    >>> M = np.array([[1, 0],
+    ...               [0, 4]])
+    >>> K = np.array([[12, -2],
+    ...               [-2, 12]])
+    >>> x0 = np.array([1, 1])
+    >>> v0 = np.array([0, 0])
+    >>> max_time = 10
+    >>> t, X = response_system_undamped_modal(M, K, x0, v0, max_time)
+    >>> print(X[:, 1])
+    [ 0.99991994  0.99997998 -0.04001478 -0.01000397]
+    >>> t, X1 = response_system_undamped_modal(M, K, x0, v0, max_time, 1)
+    >>> X1.shape
+    (4, 2500)
+    """
+
+    t = np.linspace(0, max_time, int(250 * max_time))
+
+    w, P, S, Sinv = modes_system_undamped(M, K, n_modes)
+
+    # modal initial conditions
+    r0 = Sinv @ x0
+    rd0 = Sinv @ v0
+
+    # (n_modes, len(t)) tables of cos(w*t) and sin(w*t)/w, the latter
+    # written with sinc so that rigid body modes (w = 0) give t
+    wt = np.outer(w, t)
+    cos_wt = np.cos(wt)
+    sin_wt = t * np.sinc(wt / np.pi)
+
+    x = (S * r0) @ cos_wt + (S * rd0) @ sin_wt
+    v = (S * rd0) @ cos_wt - (S * (r0 * w**2)) @ sin_wt
+
+    X = np.vstack([x, v])
+
+    return t, X
+
+
 def response_system(M, C, K, F, x0, v0, t):
     """
     This function solves the system given the initial
@@ -370,20 +881,20 @@ def response_system(M, C, K, F, x0, v0, t):
         Time evolution of the state vector.
 
     Examples:
-    >>> M = sp.array([[9, 0],
+    >>> M = np.array([[9, 0],
     ...               [0, 1]])
-    >>> K = sp.array([[27, -3],
+    >>> K = np.array([[27, -3],
     ...               [-3, 3]])
     >>> C = K/10
-    >>> x0 = sp.array([0, 1])
-    >>> v0 = sp.array([1, 0])
-    >>> t = sp.linspace(0, 10, 100)
-    >>> F = sp.vstack([0*t,
-    ...                3*sp.cos(2*t)])
+    >>> x0 = np.array([0, 1])
+    >>> v0 = np.array([1, 0])
+    >>> t = np.linspace(0, 10, 100)
+    >>> F = np.vstack([0*t,
+    ...                3*np.cos(2*t)])
     >>> tou, yout, xout = response_system(M, C, K, F, x0, v0, t)
     >>> tou[:10]
-    array([ 0.        ,  0.1010101 ,  0.2020202 ,  0.3030303 ,  0.4040404 ,
-            0.50505051,  0.60606061,  0.70707071,  0.80808081,  0.90909091])
+    array([0.        , 0.1010101 , 0.2020202 , 0.3030303 , 0.4040404 ,
+           0.50505051, 0.60606061, 0.70707071, 0.80808081, 0.90909091])
     >>> yout[:10]
     array([[ 0.        ,  1.        ,  1.        ,  0.        ],
            [ 0.1006699 ,  1.0019166 ,  0.9882704 ,  0.04164362],
@@ -410,26 +921,235 @@ def response_system(M, C, K, F, x0, v0, t):
 
     n = len(M)
 
-    Z = sp.zeros((n, n))
-    I = sp.eye(n)
-
-    # creates the state space matrix
-    A = sp.vstack([sp.hstack([Z,               I]),
-                   sp.hstack([-la.pinv(M) @ K, -la.pinv(M) @ C])])
-    B = sp.vstack([Z,
-                   la.inv(M)])
-    C = sp.eye(2*n)
+    A, B = _state_space(M, K, C)
+    C = np.eye(2*n)
     D = 0*B
 
     sys = signal.lti(A, B, C, D)
 
-    IC = sp.hstack([x0, v0])
+    IC = np.hstack([x0, v0])
     F = F.T
     T, yout, xout = signal.lsim(sys, F, t, IC)
 
     return T, yout, xout
 
 
+def response_system_modal(M, C, K, F, x0, v0, t, n_modes=None,
+                          residual=False):
+    """
+    This function solves the same problem as `response_system` by
+    modal superposition using the lowest n_modes modes of
+    `modes_system_undamped`.
+    The force is projected onto the modes, each modal equation is
+    integrated exactly (force linearly interpolated between samples, as
+    in `response_system`) and the result is mapped back to the physical
+    coordinates. The modal damping ratios are taken from the diagonal
+    of S.T @ C @ S, which is exact for proportional damping.
+
+    Parameters
+    ----------
+    M: array
+        Mass matrix
+    K: array
+        Stiffness matrix
+    C: array
+        Damping matrix. None for an undamped system.
+    F: array
+        Matrix of forces over time, one row per DOF.
+    x0: array
+        Array with displacement initial conditions
+    v0: array
+        Array with velocity initial conditions
+    t: array
+        Array withe evenly spaced times
+    n_modes: int, optional
+        Number of modes kept. Default is None, all modes are used.
+    residual: bool, optional
+        If True, the static (residual flexibility) contribution of the
+        truncated modes, (K^-1 - S @ diag(1/w**2) @ S.T) @ F, is added
+        to the displacements. K must be non singular.
+
+    Returns
+    ----------
+    T : array
+        Time values for the output.
+    yout : array
+        System response. As in `response_system`, all states are
+        output, so this is the same array as xout.
+    xout : array
+        Time evolution of the state vector.
+
+    Examples:
+    >>> M = np.array([[9, 0],
+    ...               [0, 1]])
+    >>> K = np.array([[27, -3],
+    ...               [-3, 3]])
+    >>> C = K/10
+    >>> x0 = np.array([0, 1])
+    >>> v0 = np.array([1, 0])
+    >>> t = np.linspace(0, 10, 100)
+    >>> F = np.vstack([0*t,
+    ...                3*np.cos(2*t)])
+    >>> tou, yout, xout = response_system_modal(M, C, K, F, x0, v0, t)
+    >>> print(xout[1])
+    [0.1006699  1.0019166  0.9882704  0.04164362]
+    >>> tou, yout, xout = response_system_modal(M, C, K, F, x0, v0, t,
+    ...                                         n_modes=1, residual=True)
+    >>> xout.shape
+    (100, 4)
+    """
+
+    w, P, S, Sinv = modes_system_undamped(M, K, n_modes)
+
+    if C is None:
+        zeta = np.zeros_like(w)
+    else:
+        # rigid body modes (w = 0) are left undamped
+        zeta = np.diag(S.T @ C @ S) / (2 * np.where(w > 0, w, np.inf))
+
+    F = np.asarray(F, dtype=float)
+    dt = t[1] - t[0]
+    r, rd = _sdof_filter(w, zeta, S.T @ F, Sinv @ x0, Sinv @ v0, dt)
+
+    x = S @ r
+    v = S @ rd
+    if residual:
+        if sparse.issparse(K):
+            xs = spla.spsolve(sparse.csc_matrix(K), F).reshape(F.shape)
+        else:
+            xs = la.solve(K, F)
+        x += xs - S @ ((S.T @ F) / w[:, None]**2)
+
+    xout = np.vstack([x, v]).T
+
+    return t, xout, xout
+
+
+def response_system_blocks(M, C, K, F_blocks, x0, v0, dt):
+    """
+    Generator version of `response_system` for force records that are
+    too long to hold in memory.
+    F_blocks is an iterable of force blocks, each a matrix laid out like
+    F in `response_system` (one row per DOF, one column per time step).
+    The state is carried from one block to the next and the response is
+    yielded block by block, so memory is bounded by the block size.
+
+    The force is linearly interpolated between samples, as in
+    `signal.lsim`, and the last force sample of each block is kept for
+    the first step of the next one. The result does not depend on how
+    the record is split into blocks.
+
+    Each block is run through 2*n_dof compiled first order filters, so
+    the cost is dominated by two (n_samples, 2*n_dof) matrix products
+    rather than by Python. Systems whose discrete state matrix is nearly
+    defective (e.g. critically damped modes) are stepped one sample at a
+    time instead, at about 6 us per sample.
+
+    Parameters
+    ----------
+    M: array
+        Mass matrix
+    K: array
+        Stiffness matrix
+    C: array
+        Damping matrix
+    F_blocks: iterable
+        Iterable of force matrices, (n_dof, n_samples) each
+    x0: array
+        Array with displacement initial conditions
+    v0: array
+        Array with velocity initial conditions
+    dt: float
+        Time step of the force samples
+
+    Yields
+    ----------
+    T : array
+        Time values for the block.
+    xout : array
+        Time evolution of the state vector, (n_samples, 2*n_dof).
+
+    Examples:
+    >>> M = np.array([[9, 0],
+    ...               [0, 1]])
+    >>> K = np.array([[27, -3],
+    ...               [-3, 3]])
+    >>> C = K/10
+    >>> x0 = np.array([0, 1])
+    >>> v0 = np.array([1, 0])
+    >>> t = np.linspace(0, 10, 100)
+    >>> F = np.vstack([0*t,
+    ...                3*np.cos(2*t)])
+    >>> blocks = (F[:, i:i + 30] for i in range(0, 100, 30))
+    >>> out = list(response_system_blocks(M, C, K, blocks, x0, v0, t[1]))
+    >>> [len(T) for T, xout in out]
+    [30, 30, 30, 10]
+    >>> xout = np.vstack([xout for T, xout in out])
+    >>> print(xout[1])
+    [0.1006699  1.0019166  0.9882704  0.04164362]
+    """
+
+    n = len(M)
+
+    A, B = _state_space(M, K, C)
+
+    # discretization with the force linearly interpolated over a step,
+    # the same one used by signal.lsim (row vector convention)
+    ns = 2*n
+    Md = np.zeros((ns + 2*n, ns + 2*n))
+    Md[:ns, :ns] = A * dt
+    Md[:ns, ns:ns + n] = B * dt
+    Md[ns:ns + n, ns + n:] = np.eye(n)
+    expMT = la.expm(Md.T)
+    Ad = expMT[:ns, :ns]
+    Bd1 = expMT[ns + n:, :ns]
+    Bd0 = expMT[ns:ns + n, :ns] - Bd1
+
+    x = np.hstack([x0, v0]).astype(float)
+    u = None
+    start = 0
+
+    # In the eigenvectors V of Ad the state q = V^-1 x decouples into
+    # q[i+1] = d*q[i] + h[i+1], one first order filter per eigenvalue d
+    # run by signal.lfilter. A (nearly) defective Ad has no usable V.
+    d, V = la.eig(Ad.T)
+    modal = np.linalg.cond(V) < 1e6
+    if modal:
+        Vinv = la.inv(V)
+        G0 = Bd0 @ Vinv.T
+        G1 = Bd1 @ Vinv.T
+        q = Vinv @ x
+
+    for F in F_blocks:
+        F = np.asarray(F, dtype=float).T
+        xout = np.empty((len(F), ns))
+        if modal and len(F):
+            h = np.empty((len(F), ns), dtype=complex)
+            h[1:] = F[:-1] @ G0 + F[1:] @ G1
+            if u is None:
+                h[0] = q
+                zi = np.zeros(ns)
+            else:
+                h[0] = u @ G0 + F[0] @ G1
+                zi = d * q
+            Q = np.empty_like(h)
+            for k in range(ns):
+                Q[:, k] = signal.lfilter([1.], [1., -d[k]], h[:, k],
+                                         zi=zi[k:k + 1])[0]
+            q = Q[-1]
+            u = F[-1]
+            xout[:] = (Q @ V.T).real
+        elif not modal:
+            for i, ui in enumerate(F):
+                if u is not None:
+                    x = x @ Ad + u @ Bd0 + ui @ Bd1
+                xout[i] = x
+                u = ui
+        T = dt * np.arange(start, start + len(F))
+        start += len(F)
+        yield T, xout
+
+
 if __name__ == "__main__":
     import doctest
 
@@ -1,14 +1,22 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import scipy as sp
-import matplotlib as mpl
-from scipy.interpolate import UnivariateSpline
-from IPython.display import clear_output, display, HTML
+from scipy.fftpack import next_fast_len
 from scipy import integrate
-from ipywidgets.widgets.interaction import interact, interactive
+import scipy.linalg as la
+import scipy.optimize as optimize
+import scipy.signal as signal
 
-mpl.rcParams['lines.linewidth'] = 2
-mpl.rcParams['figure.figsize'] = (10, 6)
+try:
+    from ._filter import _sdof_filter
+    from ._lazy import LazyModule, plot_style
+except ImportError:  # run as a script, python sdof.py
+    from _filter import _sdof_filter
+    from _lazy import LazyModule, plot_style
+
+# plotting and notebook widgets are imported on first use
+plt = LazyModule('matplotlib.pyplot', setup=plot_style)
+_display = LazyModule('IPython.display')
+_widgets = LazyModule('ipywidgets.widgets.interaction')
 
 
 def free_response(m=10, c=1, k=100, x0=1, v0=-1, max_time=10):
@@ -49,10 +57,11 @@ def free_response(m=10, c=1, k=100, x0=1, v0=-1, max_time=10):
            [-0.97869947]]), 0.015811388300841896, 3.1622776601683795, 3.1618823507524758, 1.0441611791969838)
     """
 
-    omega = sp.sqrt(k / m)
+    omega = np.sqrt(k / m)
     zeta = c / 2 / omega / m
-    omega_d = omega * sp.sqrt(1 - zeta ** 2)
-    A = sp.sqrt(x0 ** 2 + (v0 + omega * zeta * x0) ** 2 / omega_d ** 2)
+    # complex for over damped systems, as scipy's sqrt used to return
+    omega_d = omega * np.emath.sqrt(1 - zeta ** 2)
+    A = np.emath.sqrt(x0 ** 2 + (v0 + omega * zeta * x0) ** 2 / omega_d ** 2)
 
     #    print('The natural frequency is ', omega, 'rad/s.');
     #    print('The damping ratio is ', zeta);
@@ -72,6 +81,123 @@ def free_response(m=10, c=1, k=100, x0=1, v0=-1, max_time=10):
     return t, x, y, zeta, omega, omega_d, A
 
 
+def free_response_batch(m=10, c=1, k=100, x0=1, v0=-1, max_time=10):
+    """
+    Returns the free response of many single degree of freedom systems
+    at once using the closed form solution instead of an ode solver.
+
+    The arguments are broadcast against each other and every
+    combination is a case. Under damped, critically damped and over
+    damped systems are all evaluated with the same expression:
+    x(t) = x0*C(t) + (v0 + zeta*omega*x0)*S(t), where C and S are the
+    decaying cos/sin (exponential for zeta >= 1) terms of (1.36), (1.41)
+    and (1.45).
+
+    Parameters
+    ----------
+    m, c, k: float or array
+        Mass, damping and stiffness.
+    x0, v0: float or array
+        Initial conditions
+    max_time: float
+        End time
+
+    Returns
+    ----------
+    t: array
+        Time, shape (n_time,). Same grid as `free_response`.
+    x, v: array
+        Displacement and velocity, shape (n_cases, n_time)
+    zeta, omega: array
+        Damping ratio and natural frequency of each case, shape (n_cases,)
+
+    Examples:
+    >>> t, x, v, zeta, omega = free_response_batch(m=10, c=[1, 20, 40, 80],
+    ...                                            k=100, x0=1, v0=-1)
+    >>> x.shape
+    (4, 2500)
+    >>> print(zeta)
+    [0.01581139 0.31622777 0.63245553 1.26491106]
+    >>> _, x1, v1, *_ = free_response(m=10, c=1, k=100, x0=1, v0=-1)
+    >>> print(np.allclose(x[0], x1.ravel(), atol=1e-6))
+    True
+    """
+
+    m, c, k, x0, v0 = [a.ravel() for a in
+                       np.broadcast_arrays(*[np.asarray(a, dtype=float)
+                                             for a in (m, c, k, x0, v0)])]
+
+    t = np.linspace(0, max_time, int(250 * max_time))
+    omega = np.sqrt(k / m)
+    zeta = c / 2 / omega / m
+    x, v = _free_grid(omega, zeta, x0, v0, t)
+    return t, x, v, zeta, omega
+
+
+def _free_grid(omega, zeta, x0, v0, t):
+    """
+    Free response x, v of shape (len(omega), len(t)) on the uniform
+    grid t, see `free_response_batch`.
+    """
+    dt = t[1] - t[0]
+    sigma = zeta * omega
+    # zeta this close to 1 loses more to cancellation in (1.36)/(1.41)
+    # than (1.45) loses by ignoring the difference
+    crit = np.abs(1 - zeta ** 2) < 1e-12
+    under = (zeta < 1) & ~crit
+    over = (zeta > 1) & ~crit
+
+    x = np.empty((len(omega), len(t)))
+    v = np.empty((len(omega), len(t)))
+
+    # (1.36) written as x = Re(a*exp((-zeta*omega + i*omega_d)*t))
+    i = under
+    wd = np.sqrt(omega[i] ** 2 - sigma[i] ** 2)
+    lam = -sigma[i] + 1j * wd
+    a = x0[i] - 1j * (v0[i] + sigma[i] * x0[i]) / wd
+    x[i] = _exp_grid(lam, dt, len(t), a).real
+    v[i] = _exp_grid(lam, dt, len(t), a * lam).real
+
+    # (1.41)
+    i = over
+    mu = np.sqrt(sigma[i] ** 2 - omega[i] ** 2)
+    lam1 = -sigma[i] - mu
+    lam2 = -sigma[i] + mu
+    a1 = (lam2 * x0[i] - v0[i]) / (2 * mu)  # (1.42)
+    a2 = (v0[i] - lam1 * x0[i]) / (2 * mu)  # (1.43)
+    x[i] = _exp_grid(lam1, dt, len(t), a1) + _exp_grid(lam2, dt, len(t), a2)
+    v[i] = (_exp_grid(lam1, dt, len(t), a1 * lam1) +
+            _exp_grid(lam2, dt, len(t), a2 * lam2))
+
+    # (1.45)
+    i = crit
+    decay = _exp_grid(-omega[i], dt, len(t))
+    a1 = x0[i][:, None]  # (1.46)
+    a2 = (v0[i] + omega[i] * x0[i])[:, None]  # (1.46)
+    x[i] = (a1 + a2 * t) * decay
+    v[i] = (v0[i][:, None] - omega[i][:, None] * a2 * t) * decay
+
+    return x, v
+
+
+def _exp_grid(lam, dt, n, a=1):
+    """
+    Returns a*exp(lam*dt*j) for j = 0..n-1 as an array of shape
+    (len(lam), n), one row per exponent.
+
+    exp is only evaluated on two grids of about sqrt(n) points and the
+    rest is filled in by their outer product, so a long record costs one
+    multiplication per sample instead of an exp/cos/sin per sample.
+    """
+    lam = np.asarray(lam)
+    a = np.broadcast_to(a, lam.shape)
+    nb = int(np.ceil(np.sqrt(n)))
+    fine = a[:, None] * np.exp(lam[:, None] * dt * np.arange(nb))
+    coarse = np.exp(lam[:, None] * dt * nb * np.arange(-(-n // nb)))
+    out = coarse[:, :, None] * fine[:, None, :]
+    return out.reshape(len(lam), out.shape[1] * nb)[:, :n]
+
+
 def phase_plot(m=10, c=1, k=100, x0=1, v0=-1, max_time=10):
     '''Phase plot of free response of single degree of freedom system.
     For information on variables see `free_response`'''
@@ -90,9 +216,9 @@ def phase_plot_i(max_time=(1.0, 200.0), v0=(-100, 100, 1.0), m=(1.0, 100.0, 1.0)
                       c=(0.0, 1.0, 0.1), x0=(-100, 100, 1), k=(1.0, 100.0, 1.0)):
     '''Interactive phase plot of free response of single degree of freedom system.
     For information on variables see ``free_response``'''
-    w = interactive(phase_plot, max_time=max_time, v0=v0, m=m,
-                    c=c, x0=x0, k=k)
-    display(w)
+    w = _widgets.interactive(phase_plot, max_time=max_time, v0=v0, m=m,
+                             c=c, x0=x0, k=k)
+    _display.display(w)
 
 
 def time_plot(m=10, c=1, k=100, x0=1, v0=-1, max_time=100):
@@ -127,12 +253,12 @@ def time_plot(m=10, c=1, k=100, x0=1, v0=-1, max_time=100):
 
 def time_plot_i(max_time=(1.0, 100.0), v0=(-100, 100), m=(1.0, 100.0),
                      c=(0.0, 100.0), x0=(-100, 100), k=(1.0, 100.0)):
-    w = interactive(time_plot, max_time=max_time, v0=v0, m=m,
-                    c=c, x0=x0, k=k)
+    w = _widgets.interactive(time_plot, max_time=max_time, v0=v0, m=m,
+                             c=c, x0=x0, k=k)
     # I'd like to get the sliders to be side by side to take less vertical space
     # cont = widgets.HBox(children = w)
     # print(help(w))
-    display(w)
+    _display.display(w)
 
 
 def analytical(m=1, c=0.1, k=1, x0=1, v0=0, n=8, dt=0.05):
@@ -198,7 +324,7 @@ def euler(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05):
     Examples:
     ----------
     >>> euler(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05)
-    (array([ 0.  ,  0.05,  0.1 ,  0.15,  0.2 ,  0.25,  0.3 ,  0.35,  0.4 ]), array([[ 1.        ,  0.        ],
+    (array([0.  , 0.05, 0.1 , 0.15, 0.2 , 0.25, 0.3 , 0.35, 0.4 ]), array([[ 1.        ,  0.        ],
            [ 1.        , -0.05      ],
            [ 0.9975    , -0.09975   ],
            [ 0.9925125 , -0.14912625],
@@ -211,17 +337,17 @@ def euler(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05):
     """
 
     # creates the state space matrix
-    A = sp.array([[0, 1],
+    A = np.array([[0, 1],
                   [-k / m, -c / m]])
     # creates the x array and set the first line according to the initial
     # conditions
-    x = sp.zeros((n + 1, 2))
+    x = np.zeros((n + 1, 2))
     x[0] = x0, v0
 
     for i in range(0, n):
         x[i + 1] = x[i] + dt * A@x[i]
 
-    t = sp.linspace(0, n * dt, n + 1)
+    t = np.linspace(0, n * dt, n + 1)
 
     return t, x
 
@@ -250,7 +376,7 @@ def rk4(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05):
     Examples:
     ----------
     >>> rk4(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05)
-    (array([ 0.  ,  0.05,  0.1 ,  0.15,  0.2 ,  0.25,  0.3 ,  0.35,  0.4 ]), array([[ 1.        ,  0.        ],
+    (array([0.  , 0.05, 0.1 , 0.15, 0.2 , 0.25, 0.3 , 0.35, 0.4 ]), array([[ 1.        ,  0.        ],
            [ 0.99875234, -0.04985443],
            [ 0.99502078, -0.0993359 ],
            [ 0.98882699, -0.14832292],
@@ -261,10 +387,10 @@ def rk4(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05):
            [ 0.92210029, -0.38173305]]))
     """
 
-    t = sp.linspace(0, n * dt, n + 1)
-    x = sp.zeros((n + 1, 2))
+    t = np.linspace(0, n * dt, n + 1)
+    x = np.zeros((n + 1, 2))
     x[0, :] = x0, v0
-    A = sp.array([[0, 1],
+    A = np.array([[0, 1],
                   [-k / m, -c / m]])
 
     def f(x_): return A@x_
@@ -279,7 +405,215 @@ def rk4(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05):
     return t, x
 
 
-def euler_beam_modes(n=10, bctype=2, beamparams=sp.array((7.31e10, 1 / 12 * 0.03 * .015 ** 3, 2747, .015 * 0.03, 0.4)),
+def state_transition(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05):
+    """
+    Returns free response of a second order linear ordinary differential equation
+    using the exact state transition matrix expm(A*dt) for integration.
+
+    Unlike `euler` and `rk4` there is no truncation error, and any
+    number of initial conditions are propagated at once. The powers of
+    the transition matrix are built by repeated doubling, so the whole
+    record takes log2(n) vectorized matrix products instead of n Python
+    steps.
+
+    Parameters
+    ----------
+    m, c, k: float
+        Mass, damping and stiffness.
+    x0, v0: float or array
+        Initial conditions. Arrays of shape (n_cases,) are integrated
+        together.
+    n: int
+        The number of steps
+    dt: float
+        The step size.
+
+    Returns
+    ----------
+    t, x: array
+        Time and state (displacement, velocity). x has shape (n+1, 2)
+        like `euler` and `rk4`, or (n+1, 2, n_cases) for arrays of
+        initial conditions.
+
+    Examples:
+    ----------
+    >>> t, x = state_transition(m=1, c=.1, k=1, x0=1, v0=0, n=8, dt=0.05)
+    >>> print(x[-1])
+    [ 0.92210028 -0.38173307]
+    >>> t, x = state_transition(x0=[1, 0, 1], v0=[0, 1, 1], n=8, dt=0.05)
+    >>> x.shape
+    (9, 2, 3)
+    """
+
+    A = np.array([[0, 1],
+                  [-k / m, -c / m]])
+    Ad = la.expm(A * dt)
+
+    # P[i] = Ad**i, filled in by doubling: Ad**(j + s) = Ad**j @ Ad**s
+    P = np.empty((n + 1, 2, 2))
+    P[0] = np.eye(2)
+    filled = 1
+    step = Ad
+    while filled < n + 1:
+        count = min(filled, n + 1 - filled)
+        P[filled:filled + count] = P[:count] @ step
+        filled += count
+        step = step @ step
+
+    # the initial conditions form one (2, n_cases) block
+    x0, v0 = np.broadcast_arrays(np.asarray(x0, dtype=float),
+                                 np.asarray(v0, dtype=float))
+    x = P @ np.array([x0, v0]).reshape(2, -1)
+    if x0.ndim == 0:
+        x = x[:, :, 0]
+
+    t = np.linspace(0, n * dt, n + 1)
+
+    return t, x
+
+
+# beta*L roots of the Euler beam characteristic equations, elastic modes
+# only, to full double precision. Extended on demand by _beam_roots until
+# the roots agree with their asymptotic values.
+_beam_root_table = {
+    1: [4.730040744862704, 7.853204624095838, 10.995607838001671,
+        14.137165491257464, 17.27875965739948, 20.42035224562606,
+        23.561944902040455, 26.703537555508188],
+    2: [1.8751040687119611, 4.694091132974175, 7.854757438237613,
+        10.995540734875465, 14.13716839104647, 17.278759532088237,
+        20.42035225104125, 23.561944901806445],
+    3: [3.9266023120479185, 7.068582745628732, 10.21017612281303,
+        13.351768777754094, 16.49336143134641],
+    4: [2.3650203724313514, 5.497803919000836, 8.639379828699742,
+        11.780972451020228, 14.922565104551627],
+    5: [4.730040744862704, 7.853204624095838, 10.995607838001671,
+        14.137165491257464, 17.27875965739948, 20.42035224562606,
+        23.561944902040455, 26.703537555508188]}
+_beam_root_complete = set((3, 4))
+
+
+def _beam_asymptote(bctype, k):
+    """Asymptotic beta*L of the k-th elastic mode (k counts from 1)."""
+    k = np.asarray(k, dtype=float)
+    if bctype in (1, 5):
+        return (2 * k + 1) * np.pi / 2
+    if bctype == 2:
+        return (2 * k - 1) * np.pi / 2
+    if bctype == 3:
+        return (4 * k + 1) * np.pi / 4
+    return (4 * k - 1) * np.pi / 4
+
+
+def _beam_characteristic(b, bctype):
+    """Characteristic equation divided by cosh(b), so it cannot overflow."""
+    E = np.exp(-b)
+    if bctype in (1, 5):
+        return np.cos(b) - 2 * E / (1 + E * E)
+    if bctype == 2:
+        return np.cos(b) + 2 * E / (1 + E * E)
+    tanh = (1 - E * E) / (1 + E * E)
+    if bctype == 3:
+        return np.sin(b) - np.cos(b) * tanh
+    return np.sin(b) + np.cos(b) * tanh
+
+
+def _beam_roots(bctype, k):
+    """
+    beta*L of the elastic modes k (counting from 1) for boundary condition
+    bctype 1-5. Roots missing from the table are found with brentq and
+    kept, beyond that the asymptotic value is exact in double precision.
+    """
+    k = np.asarray(k, dtype=int)
+    table = _beam_root_table[bctype]
+    kmax = k.max() if k.size else 0
+    while len(table) < kmax and bctype not in _beam_root_complete:
+        a = float(_beam_asymptote(bctype, len(table) + 1))
+        root = optimize.brentq(_beam_characteristic, a - np.pi / 4,
+                               a + np.pi / 4, args=(bctype,), xtol=1e-15,
+                               rtol=4 * np.finfo(float).eps)
+        if root == a:
+            _beam_root_complete.add(bctype)
+        else:
+            table.append(root)
+    Bnl = _beam_asymptote(bctype, k)
+    known = k <= len(table)
+    Bnl[known] = np.asarray(table)[k[known] - 1]
+    return Bnl
+
+
+def _beam_grid(B, xi):
+    """
+    exp(-z), exp(z - B), cos(z) and sin(z) for z = B*xi, each of shape
+    (len(B), len(xi)). An integer xi stands for a uniform grid of xi
+    points on [0, 1], which is filled in by `_exp_grid`.
+    """
+    if np.ndim(xi) == 0:
+        h = 1 / max(xi - 1, 1)
+        em = _exp_grid(-B, h, xi)
+        ej = _exp_grid(1j * B, h, xi)
+        return em, em[:, ::-1], ej.real, ej.imag
+    z = B[:, None] * xi
+    return np.exp(-z), np.exp(z - B[:, None]), np.cos(z), np.sin(z)
+
+
+def _beam_betas(n, bctype):
+    """beta*L of modes n (counting from 1), zero for rigid body modes."""
+    n = np.atleast_1d(np.asarray(n, dtype=int))
+    if bctype == 6:
+        return n * np.pi
+    Bnl = np.zeros(n.shape)
+    elastic = n > 2 if bctype == 1 else np.ones(n.shape, dtype=bool)
+    Bnl[elastic] = _beam_roots(bctype, n[elastic] - 2 * (bctype == 1))
+    return Bnl
+
+
+def _beam_shapes(n, bctype, xi):
+    """
+    beta*L and unnormalized shapes of modes n (counting from 1) at the
+    normalized positions xi, shape (len(xi), len(n)). An integer xi is a
+    uniform grid of xi points on [0, 1].
+
+    The hyperbolic terms are written as exp(b*xi - b) and exp(-b*xi), so
+    they stay bounded for any mode number.
+    """
+    n = np.atleast_1d(np.asarray(n, dtype=int))
+    if np.ndim(xi) != 0:
+        xi = np.asarray(xi, dtype=float).ravel()
+    Bnl = _beam_betas(n, bctype)
+    if bctype == 6:
+        return Bnl, _beam_grid(Bnl, xi)[3].T
+
+    U = np.empty((n.size, xi if np.ndim(xi) == 0 else xi.size))
+    elastic = n > 2 if bctype == 1 else np.ones(n.shape, dtype=bool)
+    if bctype == 1:
+        U[n == 1] = 1.0
+        U[n == 2] = (np.linspace(0, 1, xi) if np.ndim(xi) == 0 else xi) - 0.5
+
+    B = Bnl[elastic]
+    E = np.exp(-B)
+    c = np.cos(B)
+    s = np.sin(B)
+    # sig = N/D, with N, D and D - N = E*g all scaled by 2*exp(-B)
+    if bctype == 2:
+        N, D, g = 1 - E * E - 2 * E * s, 1 + E * E + 2 * E * c, 2 * (E + c + s)
+    elif bctype == 4:
+        N, D, g = 1 - E * E + 2 * E * s, 1 + E * E - 2 * E * c, 2 * (E - c - s)
+    else:
+        N, D, g = 1 + E * E - 2 * E * c, 1 - E * E - 2 * E * s, 2 * (c - s - E)
+    sig = (N / D)[:, None]
+    em, ep, cz, sz = _beam_grid(B, xi)
+    hyp = (g / (2 * D))[:, None] * ep + ((D + N) / (2 * D))[:, None] * em
+    trig = cz - sig * sz
+    U[elastic] = hyp + trig if bctype == 1 else hyp - trig
+    return Bnl, U.T
+
+
+# E, I, rho, A, L of the default beam, aluminum 15x30 mm, 0.4 m long
+_beam_params = np.array((7.31e10, 1 / 12 * 0.03 * .015 ** 3, 2747, .015 * 0.03, 0.4))
+_beam_params.setflags(write=False)
+
+
+def euler_beam_modes(n=10, bctype=2, beamparams=_beam_params,
                      npoints=2001):
     """
     %VTB6_3 Natural frequencies and mass normalized mode shape for an Euler-
@@ -317,121 +651,32 @@ def euler_beam_modes(n=10, bctype=2, beamparams=sp.array((7.31e10, 1 / 12 * 0.03
 
     % Copyright Joseph C. Slater, 2007
     % Engineering Vibration Toolbox
+
+    Examples:
+    >>> w, x, U = euler_beam_modes(n=3, bctype=2)
+    >>> print(np.round(w / w[0], 4))
+    [ 1.      6.2669 17.5475]
+    >>> w, x, U = euler_beam_modes(n=500, bctype=5)
+    >>> U.shape
+    (2001, 500)
     """
     E = beamparams[0]
     I = beamparams[1]
     rho = beamparams[2]
     A = beamparams[3]
     L = beamparams[4]
-    if isinstance(n, int):
-        ln = n
-        n = sp.arange(n) + 1
-    else:
-        ln = len(n)
-
-    # len=[0:(1/(npoints-1)):1]';  %Normalized length of the beam
-    len = sp.linspace(0, 1, npoints)
-    x = len * L
-    # Determine natural frequencies and mode shapes depending on the
-    # boundary condition.
-    # Mass simplification. The following was arange_(1,length_(n)).reshape(-1)
-    mode_num_range = sp.arange(0, ln)
-    Bnl = sp.empty(ln)
-    w = sp.empty(ln)
-    U = sp.empty([npoints, ln])
+    if np.ndim(n) == 0:
+        n = np.arange(n) + 1
 
-    if bctype == 1:
-        desc = 'Free-Free '
-        Bnllow = sp.array((0, 0, 4.73004074486, 7.8532046241,
-                           10.995607838, 14.1371654913, 17.2787596574))
-        for i in mode_num_range:
-            if n[i] > 7:
-                Bnl[i] = (2 * n[i] - 3) * sp.pi / 2
-            else:
-                Bnl[i] = Bnllow[i]
-        for i in mode_num_range:
-            if n[i] == 1:
-                w[i] = 0
-                U[:, i] = 1 + len * 0
-            elif n[i] == 2:
-                w[i] = 0
-                U[:, i] = len - 0.5
-            else:
-                sig = (sp.cosh(Bnl[i]) - sp.cos(Bnl[i])) / \
-                      (sp.sinh(Bnl[i]) - sp.sin(Bnl[i]))
-                w[i] = (Bnl[i] ** 2) * sp.sqrt(E * I / (rho * A * L ** 4))
-                b = Bnl[i] * len
-                U[:, i] = sp.cosh(b) + sp.cos(b) - sig * \
-                    (sp.sinh(b) + sp.sin(b))
-    elif bctype == 2:
-        desc = 'Clamped-Free '
-        Bnllow = sp.array((1.88, 4.69, 7.85, 10.99, 14.14))
-        for i in mode_num_range:
-            if n[i] > 4:
-                Bnl[i] = (2 * n[i] - 1) * sp.pi / 2
-            else:
-                Bnl[i] = Bnllow[i]
-
-        for i in mode_num_range:
-            sig = (sp.sinh(Bnl[i]) - sp.sin(Bnl[i])) / \
-                  (sp.cosh(Bnl[i]) - sp.cos(Bnl[i]))
-            w[i] = (Bnl[i] ** 2) * sp.sqrt(E * I / (rho * A * L ** 4))
-            b = Bnl[i] * len
-            # plt.plot(x,(sp.cosh(b) - sp.cos(b) - sig * (sp.sinh(b) - sp.sin(b))))
-            U[:, i] = sp.cosh(b) - sp.cos(b) - sig * (sp.sinh(b) - sp.sin(b))
-
-    elif bctype == 3:
-        desc = 'Clamped-Pinned '
-        Bnllow = sp.array((3.93, 7.07, 10.21, 13.35, 16.49))
-        for i in mode_num_range:
-            if n[i] > 4:
-                Bnl[i] = (4 * n[i] + 1) * sp.pi / 4
-            else:
-                Bnl[i] = Bnllow[i]
-        for i in mode_num_range:
-            sig = (sp.cosh(Bnl[i]) - sp.cos(Bnl[i])) / \
-                  (sp.sinh(Bnl[i]) - sp.sin(Bnl[i]))
-            w[i] = (Bnl[i] ** 2) * sp.sqrt(E * I / (rho * A * L ** 4))
-            b = Bnl[i] * len
-            U[:, i] = sp.cosh(b) - sp.cos(b) - sig * (sp.sinh(b) - sp.sin(b))
-    elif bctype == 4:
-        desc = 'Clamped-Sliding '
-        Bnllow = sp.array((2.37, 5.5, 8.64, 11.78, 14.92))
-        for i in mode_num_range:
-            if n[i] > 4:
-                Bnl[i] = (4 * n[i] - 1) * sp.pi / 4
-            else:
-                Bnl[i] = Bnllow[i]
-        for i in mode_num_range:
-            sig = (sp.sinh(Bnl[i]) + sp.sin(Bnl[i])) / \
-                  (sp.cosh(Bnl[i]) - sp.cos(Bnl[i]))
-            w[i] = (Bnl[i] ** 2) * sp.sqrt(E * I / (rho * A * L ** 4))
-            b = Bnl[i] * len
-            U[:, i] = sp.cosh(b) - sp.cos(b) - sig * (sp.sinh(b) - sp.sin(b))
-    elif bctype == 5:
-        desc = 'Clamped-Clamped '
-        Bnllow = sp.array((4.73, 7.85, 11, 14.14, 17.28))
-        for i in mode_num_range:
-            if n[i] > 4:
-                Bnl[i] = (2 * n[i] + 1) * sp.pi / 2
-            else:
-                Bnl[i] = Bnllow[i]
-        for i in mode_num_range:
-            sig = (sp.cosh(Bnl[i]) - sp.cos(Bnl[i])) / \
-                  (sp.sinh(Bnl[i]) - sp.sin(Bnl[i]))
-            w[i] = (Bnl[i] ** 2) * sp.sqrt(E * I / (rho * A * L ** 4))
-            b = Bnl[i] * len
-            U[:, i] = sp.cosh(b) - sp.cos(b) - sig * (sp.sinh(b) - sp.sin(b))
-    elif bctype == 6:
-        desc = 'Pinned-Pinned '
-        for i in mode_num_range:
-            Bnl[i] = n[i] * sp.pi
-            w[i] = (Bnl[i] ** 2) * sp.sqrt(E * I / (rho * A * L ** 4))
-            U[:, i] = sp.sin(Bnl[i] * len)
+    # Normalized length of the beam
+    xi = np.linspace(0, 1, npoints)
+    x = xi * L
+    # All modes at once, (npoints, n_modes)
+    Bnl, U = _beam_shapes(n, bctype, npoints)
+    w = (Bnl ** 2) * np.sqrt(E * I / (rho * A * L ** 4))
 
     # Mass Normalization of mode shapes
-    for i in mode_num_range:
-        U[:, i] = U[:, i] / sp.sqrt(sp.dot(U[:, i], U[:, i]) * rho * A * L)
+    U = U / np.sqrt(np.sum(U ** 2, axis=0) * rho * A * L)
 
     """
     ppause=0
@@ -489,70 +734,207 @@ def euler_beam_modes(n=10, bctype=2, beamparams=sp.array((7.31e10, 1 / 12 * 0.03
     return w, x, U
 
 
-def euler_beam_frf(xin=0.22, xout=0.22, fmin=0.0, fmax=1000.0, zeta=0.02,
-                   beamparams=sp.array((7.31e10, 1 / 12 * 0.03 * .015 ** 3, 2747, .015 * 0.03, 0.4)), bctype=2):
-    print(fmin)
+def _beam_mode_count(bctype, Blim):
+    """Number of modes up to and including the first with beta*L >= Blim."""
+    n = int(Blim / np.pi) + 4
+    Bnl = _beam_betas(np.arange(n) + 1, bctype)
+    return int(np.argmax(Bnl >= Blim)) + 1
+
+
+def _beam_frf_modes(x, fmax, beamparams, bctype, n_modes):
+    """
+    Natural frequencies and mass normalized mode shapes at the locations
+    x, shape (len(x), n_modes), for modal summation up to fmax.
+    """
     E = beamparams[0]
     I = beamparams[1]
     rho = beamparams[2]
     A = beamparams[3]
     L = beamparams[4]
-    np = 2001
-    i = 0
-    w = sp.linspace(fmin, fmax, 2001) * 2 * sp.pi
-    if min([xin, xout]) < 0 or max([xin, xout]) > L:
-        disp_(char('One or both locations are not on the beam'))
-        return
-    wn = sp.array((0, 0))
-    # The number 100 is arbitrarily large and unjustified.
-    a = sp.empty([np, 100], dtype=complex)
-    f = sp.empty(100)
-
-    while wn[-1] < 1.3 * (fmax * 2 * sp.pi):
-        i = i + 1
-        # legtext[i + 1]=[char('Contribution of mode '),num2str_(i)]
-        wn, xx, U = euler_beam_modes(i, bctype, beamparams, 5000)
-        spl = UnivariateSpline(xx, U[:, i - 1])
-        Uin = spl(xin)
-        Uout = spl(xout)
-        # Uin=spline_(xx,U,xin)
-        # Uout=spline_(xx,U,xout)
-
-        # print(wn[-1])
-        # print(w)
-        a[:, i - 1] = rho * A * Uin * Uout / \
-            (wn[-1] ** 2 - w ** 2 + 2 * zeta * wn[-1] * w * sp.sqrt(-1))
-        # print(a[0:10,i])
-        # plt.plot(sp.log10(sp.absolute(a[:,i])))
-        # input("Press Enter to continue...")
-        f[i] = wn[-1] / 2 / sp.pi
-    a = a[:, 0:i]
+    x = np.atleast_1d(np.asarray(x, dtype=float))
+    if x.min() < 0 or x.max() > L:
+        raise ValueError('One or both locations are not on the beam')
+    alpha = np.sqrt(E * I / (rho * A * L ** 4))
+    if n_modes is None:
+        n_modes = _beam_mode_count(bctype, np.sqrt(1.3 * fmax * 2 * np.pi / alpha))
+
+    n = np.arange(n_modes) + 1
+    Bnl, U = _beam_shapes(n, bctype, x / L)
+    # integral of U**2 over the normalized length
+    m = np.full(n_modes, 0.5 if bctype == 6 else 1.0)
+    if bctype == 1:
+        m[n == 2] = 1 / 12
+    return Bnl ** 2 * alpha, U / np.sqrt(rho * A * L * m)
+
+
+def euler_beam_frf_data(xin=0.22, xout=0.22, fmin=0.0, fmax=1000.0, zeta=0.02,
+                        beamparams=_beam_params,
+                        bctype=2, n_modes=None, npoints=2001, f=None):
+    """
+    Frequency response function of an Euler-Bernoulli beam between xin and
+    xout by modal summation, without plotting. See `euler_beam_frf`.
+
+    The mode shapes are evaluated analytically at xin and xout only, and
+    all modal contributions are computed in one (npoints, n_modes)
+    broadcast.
+
+    Parameters
+    ----------
+    xin, xout: float
+        Drive and response locations along the beam
+    fmin, fmax: float
+        Frequency range (Hz)
+    zeta: float
+        Modal damping ratio
+    beamparams: array
+        [E I rho A L], see `euler_beam_modes`
+    bctype: int
+        Boundary condition, see `euler_beam_modes`
+    n_modes: int, optional
+        Number of modes. By default all modes up to 1.3*fmax and the first
+        one above it.
+    npoints: int
+        Number of frequencies
+    f: array, optional
+        Frequencies (Hz) to use instead of the uniform grid, e.g. from
+        `frequency_grid`. fmin, fmax and npoints are then not used.
+
+    Returns
+    ----------
+    fout: array
+        Frequencies (Hz)
+    H: array
+        Receptance contribution of each mass normalized mode,
+        (npoints, n_modes). The FRF is H.sum(axis=1).
+
+    Examples:
+    >>> fout, H = euler_beam_frf_data(fmax=20000.0)
+    >>> H.shape
+    (2001, 12)
+    >>> print(round(abs(H.sum(axis=1)[0]) * 1e6, 6))
+    5.754381
+    >>> # refine around the natural frequencies only
+    >>> wn, _, _ = euler_beam_modes(12, 2, npoints=2)
+    >>> f = frequency_grid(0, 20000.0, wn / 2 / np.pi, 0.02)
+    >>> fout, H = euler_beam_frf_data(fmax=20000.0, f=f)
+    >>> H.shape
+    (609, 12)
+    """
+    f = np.linspace(fmin, fmax, npoints) if f is None else np.asarray(f, dtype=float)
+    wn, U = _beam_frf_modes([xin, xout], f.max(), beamparams, bctype, n_modes)
+    w = f[:, None] * 2 * np.pi
+    H = U[0] * U[1] / (wn ** 2 - w ** 2 + 2j * zeta * wn * w)
+    return w[:, 0] / 2 / np.pi, H
+
+
+def euler_beam_frf_grid(xin, xout, fmin=0.0, fmax=1000.0, zeta=0.02,
+                        beamparams=_beam_params,
+                        bctype=2, n_modes=None, npoints=2001, f=None, out=None):
+    """
+    Frequency response functions of an Euler-Bernoulli beam from every
+    drive point in xin to every response point in xout, e.g. for
+    operating deflection shapes or sensor placement.
+
+    One modal decomposition is shared by all pairs: with the mode shape
+    matrices Phi_in (n_in, n_modes) and Phi_out (n_out, n_modes),
+    H[:, :, k] = Phi_in @ diag(g(w_k)) @ Phi_out.T. The frequencies are
+    processed in chunks, so apart from the result memory use does not
+    depend on npoints. The result can be written to `out`, e.g. a
+    numpy.memmap.
+
+    Parameters
+    ----------
+    xin: array
+        Drive locations along the beam, (n_in,)
+    xout: array
+        Response locations along the beam, (n_out,)
+    fmin, fmax, zeta, beamparams, bctype, n_modes, npoints, f:
+        See `euler_beam_frf_data`
+    out: array, optional
+        Complex array of shape (n_in, n_out, n_freq) to fill
+
+    Returns
+    ----------
+    fout: array
+        Frequencies (Hz)
+    H: array
+        Receptance, (n_in, n_out, n_freq)
+
+    Examples:
+    >>> fout, H = euler_beam_frf_grid([0.1, 0.22], [0.1, 0.2, 0.4], fmax=20000.0)
+    >>> H.shape
+    (2, 3, 2001)
+    >>> _, H1 = euler_beam_frf_data(0.22, 0.4, fmax=20000.0)
+    >>> bool(np.allclose(H[1, 2], H1.sum(axis=1)))
+    True
+    """
+    xin = np.atleast_1d(np.asarray(xin, dtype=float))
+    xout = np.atleast_1d(np.asarray(xout, dtype=float))
+    f = np.linspace(fmin, fmax, npoints) if f is None else np.asarray(f, dtype=float)
+    wn, U = _beam_frf_modes(np.concatenate((xin, xout)), f.max(), beamparams,
+                            bctype, n_modes)
+    Uin, Uout = U[:len(xin)], U[len(xin):]
+    w = f * 2 * np.pi
+    if out is None:
+        out = np.empty((len(xin), len(xout), len(f)), dtype=complex)
+
+    width = len(xin) * max(len(wn), len(xout))
+    block = max(1, 2**20 // width)
+    for i in range(0, len(f), block):
+        wk = w[i:i + block, None]
+        g = 1 / (wn ** 2 - wk ** 2 + 2j * zeta * wn * wk)
+        # (chunk, n_in, n_modes) @ (n_modes, n_out)
+        out[:, :, i:i + block] = np.moveaxis((Uin * g[:, None, :]) @ Uout.T, 0, -1)
+    return w / 2 / np.pi, out
+
+
+def euler_beam_frf(xin=0.22, xout=0.22, fmin=0.0, fmax=1000.0, zeta=0.02,
+                   beamparams=_beam_params, bctype=2, n_modes=None,
+                   f=None):
+    """
+    Plots the frequency response function of an Euler-Bernoulli beam,
+    the total and the contribution of each mode, magnitude and phase.
+
+    Parameters
+    ----------
+    xin, xout, fmin, fmax, zeta, beamparams, bctype, n_modes, f:
+        See `euler_beam_frf_data`
+
+    Returns
+    ----------
+    fout: array
+        Frequencies (Hz)
+    H: array
+        Receptance contribution of each mode, (len(fout), n_modes)
+
+    Examples:
+    >>> fout, H = euler_beam_frf(n_modes=4)
+    >>> H.shape
+    (2001, 4)
+    """
+    fout, H = euler_beam_frf_data(xin, xout, fmin, fmax, zeta, beamparams,
+                                  bctype, n_modes, f=f)
     plt.subplot(211)
-    plt.plot(w / 2 / sp.pi, 20 * sp.log10(sp.absolute(sp.sum(a, axis=1))), '-')
-    plt.hold('on')
-    plt.plot(w / 2 / sp.pi, 20 * sp.log10(sp.absolute(a)), '-')
+    plt.plot(fout, 20 * np.log10(np.absolute(np.sum(H, axis=1))), '-')
+    plt.plot(fout, 20 * np.log10(np.absolute(H)), '-')
     plt.grid('on')
     plt.xlabel('Frequency (Hz)')
     plt.ylabel('FRF (dB)')
     axlim = plt.axis()
 
     plt.axis(
-        axlim + sp.array([0, 0, -0.1 * (axlim[3] - axlim[2]), 0.1 * (axlim[3] - axlim[2])]))
+        axlim + np.array([0, 0, -0.1 * (axlim[3] - axlim[2]), 0.1 * (axlim[3] - axlim[2])]))
 
     plt.subplot(212)
-    plt.plot(w / 2 / sp.pi, sp.unwrap(sp.angle(sp.sum(a, axis=1))) /
-             sp.pi * 180, '-')
-    plt.hold('on')
-    plt.plot(w / 2 / sp.pi, sp.unwrap(sp.angle(a)) / sp.pi * 180, '-')
+    plt.plot(fout, np.unwrap(np.angle(np.sum(H, axis=1))) / np.pi * 180, '-')
+    plt.plot(fout, np.unwrap(np.angle(H), axis=0) / np.pi * 180, '-')
     plt.grid('on')
     plt.xlabel('Frequency (Hz)')
     plt.ylabel('Phase (deg)')
     axlim = plt.axis()
     plt.axis(
-        axlim + sp.array([0, 0, -0.1 * (axlim[3] - axlim[2]), 0.1 * (axlim[3] - axlim[2])]))
+        axlim + np.array([0, 0, -0.1 * (axlim[3] - axlim[2]), 0.1 * (axlim[3] - axlim[2])]))
 
-    fout = w / 2 / sp.pi
-    H = a
     return fout, H
 
 
@@ -591,65 +973,202 @@ def frfplot(f, H):
         axlim + sp.array([0, 0, -0.1 * (axlim[3] - axlim[2]), 0.1 * (axlim[3] - axlim[2])]))
 
 
-def response(xdd, f, t, x0, v0):
-    """
-    returns t, x, v
-    :math:`\ddot{x} = g(x,v) + f(t)`
-    given initial conditions :math:`x_0` and :math:`\dot{x}_0 = v_0` for the time `t`
+def response(m, c, k, f, t, x0=0, v0=0, hold='foh'):
+    r"""
+    Returns the response of a single degree of freedom system
+    :math:`m\ddot{x} + c\dot{x} + kx = f(t)` to a sampled force record,
+    given initial conditions :math:`x_0` and :math:`\dot{x}_0 = v_0`.
 
-*** Function hasn't been written yet... work in progress. Mimics vtb1_3
-    Parameters
+    The system is discretized exactly for the time step of t, with f
+    linearly interpolated between samples (first order hold) or held
+    constant over each step (zero order hold). The response is then a
+    two pole recursion run by `scipy.signal.lfilter`, so the cost is a
+    few flops per sample and records of millions of samples are fine.
+    The result is exact for any time step as far as f follows the hold;
+    the step only needs to resolve the force, not the system.
 
-    m, c, k:           1) Floats. Mass, damping and stiffness.
-    x0, v0:            2) Floats. Initial conditions
-    max_time:          3) Float. end time or response to be returned
+    Replaces vtb1_3, which integrates a (possibly nonlinear) equation
+    with Runge-Kutta. For linear systems only.
+
+    Parameters
+    ----------
+    m, c, k: float
+        Mass, damping and stiffness
+    f: array
+        Force at the times t, shape (n_time,), or (n_channels, n_time)
+        for several records at once
+    t: array
+        Uniformly spaced times
+    x0, v0: float or array
+        Initial conditions, one for all channels or one per channel
+    hold: str
+        'foh' (first order hold) or 'zoh' (zero order hold)
 
     Returns
+    ----------
+    t, x, v: array
+        Time, displacement and velocity, x and v with the shape of f
 
-    t, x, v: 1) Arrays. Time, displacement, and velocity
+    Examples:
+    >>> t = np.linspace(0, 20, 201)
+    >>> t, x, v = response(10, 2, 1000, np.zeros_like(t), t, x0=1, v0=0)
+    >>> print(round(x[-1], 6))
+    0.06356
+    >>> f = np.vstack((30 * np.sin(10 * t), np.ones_like(t)))
+    >>> t, x, v = response(10, 2, 1000, f, t)
+    >>> x.shape
+    (2, 201)
+    """
 
-    :Example:
-    >>> free_response()
-    (array([  0.00000000e+00,   4.00160064e-03,   8.00320128e-03, ...,
-             9.99199680e+00,   9.99599840e+00,   1.00000000e+01]), array([[ 1.        ],
-           [ 0.99591926],
-           [ 0.9916807 ],
-           ..., 
-           [ 0.56502396],
-           [ 0.56123989],
-           [ 0.55736747]]), array([[-1.        ],
-           [-1.03952678],
-           [-1.07887136],
-           ..., 
-           [-0.93454914],
-           [-0.95670532],
-           [-0.97869947]]), 0.015811388300841896, 3.1622776601683795, 3.1618823507524758, 1.0441611791969838)
+    t = np.asarray(t, dtype=float)
+    f = np.asarray(f, dtype=float)
+    w = np.sqrt(k / m)
+    zeta = c / 2 / w / m
+    x, v = _sdof_filter(w, zeta, f.reshape(-1, f.shape[-1]) / m, x0, v0,
+                        t[1] - t[0], hold)
+    return t, x.reshape(f.shape), v.reshape(f.shape)
+
+
+class HarmonicResponse(object):
     """
+    Closed-form response of an undamped single degree of freedom system
+    to the force F0*cos(wdr*t), evaluated only where it is asked for.
 
-    omega = sp.sqrt(k / m)
-    zeta = c / 2 / omega / m
-    omega_d = omega * sp.sqrt(1 - zeta**2)
-    A = sp.sqrt(x0**2 + (v0 + omega * zeta * x0)**2 / omega_d**2)
-#    print('The natural frequency is ', omega, 'rad/s.');
-#    print('The damping ratio is ', zeta);
-#    print('The damped natural frequency is ', omega_d);
+    x(t) = a*cos(w*t) + b*sin(w*t) + X*cos(wdr*t) + s*t*sin(w*t)
 
-    def sdofs_deriv(x_xd, t0, m=m, c=c, k=k):
-        x, xd = x_xd
-        return [xd, -c / m * xd - k / m * x]
+    where s is nonzero only at resonance (wdr == w), in which case X is 0.
+    Calling the object evaluates x at any times. Indexing it evaluates x
+    on the default time grid from 0 to tf, whose spacing is set by the
+    faster of w and wdr, so r[::100] or r[-10:] only compute the
+    samples they return. The full grid is made only by `t` and `x`.
 
-    z0 = np.array([[x0, v0]])
-    # Solve for the trajectories
-    t = np.linspace(0, max_time, int(250 * max_time))
-    z_t = np.asarray([integrate.odeint(sdofs_deriv, z0i, t)
-                      for z0i in z0])
+    Parameters
+    ----------
+    w: float
+        Natural frequency (rad/s)
+    wdr: float
+        Force frequency (rad/s)
+    f0: float
+        Force magnitude divided by the mass
+    x0, v0: float
+        Initial conditions
+    tf: float
+        End time of the default grid
+    points_per_period: int
+        Samples per period of the faster of w and wdr in the default grid
 
-    x, y = z_t[:, :].T
-    return t, x, y, zeta, omega, omega_d, A
+    Attributes
+    ----------
+    a, b, X, s: float
+        Coefficients of x(t)
+    n: int
+        Length of the default grid
+
+    Examples:
+    >>> r = HarmonicResponse(np.sqrt(10), 0.5, 1, 1, 0, 100)
+    >>> print(round(r(100.0), 6))
+    -0.329474
+    >>> len(r), r[::500].shape
+    (2518, (6,))
+    """
+
+    def __init__(self, w, wdr, f0, x0, v0, tf, points_per_period=50):
+        self.w = w
+        self.wdr = wdr
+        self.tf = tf
+        self.b = v0 / w
+        if w == wdr:
+            self.X = 0.0
+            self.s = f0 / (2 * w)
+        else:
+            self.X = f0 / (w**2 - wdr**2)   # (2.11)
+            self.s = 0.0
+        self.a = x0 - self.X
+        periods = tf * max(w, wdr) / (2 * np.pi)
+        self.n = max(int(np.ceil(periods * points_per_period)) + 1, 2)
+
+    def __call__(self, t):
+        """Displacement at the times t."""
+        t = np.asarray(t, dtype=float)
+        wt = self.w * t
+        x = self.a * np.cos(wt) + self.b * np.sin(wt)
+        if self.s:
+            x += self.s * t * np.sin(wt)
+        if self.X:
+            x += self.X * np.cos(self.wdr * t)
+        return x
+
+    def velocity(self, t):
+        """Velocity at the times t."""
+        t = np.asarray(t, dtype=float)
+        wt = self.w * t
+        v = self.w * (self.b * np.cos(wt) - self.a * np.sin(wt))
+        if self.s:
+            v += self.s * (np.sin(wt) + wt * np.cos(wt))
+        if self.X:
+            v -= self.X * self.wdr * np.sin(self.wdr * t)
+        return v
+
+    @property
+    def dt(self):
+        """Time step of the default grid."""
+        return self.tf / (self.n - 1)
+
+    @property
+    def t(self):
+        """Default time grid."""
+        return np.linspace(0, self.tf, self.n)
+
+    @property
+    def x(self):
+        """Displacement on the default time grid."""
+        return self(self.t)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            i = np.arange(*index.indices(self.n))
+        else:
+            i = np.arange(self.n)[index]
+        return self(i * self.dt)
+
+    def __repr__(self):
+        return '<HarmonicResponse: w=%g, wdr=%g, %d samples to t=%g>' % (
+            self.w, self.wdr, self.n, self.tf)
+
+
+def forced_analytical_response(m=10, k=100, x0=1, v0=0,
+                               wdr=0.5, F0=10, tf=100, points_per_period=50):
+    """
+    Returns the response of an undamped single degree of freedom system
+    to a sinusoidal input with amplitude F0 and frequency wdr as a
+    `HarmonicResponse`, which evaluates x(t) on demand.
+
+    Parameters
+    ----------
+    m, k, x0, v0, wdr, F0, tf:
+        See `forced_analytical`
+    points_per_period: int
+        Samples per period of the default time grid
+
+    Returns
+    ----------
+    r: HarmonicResponse
+        Response, r(t) for any times t, r[i] on the default grid
+
+    Examples:
+    >>> r = forced_analytical_response()
+    >>> print(np.round(r([0, 100]), 6))
+    [ 1.       -0.329474]
+    """
+    return HarmonicResponse(np.sqrt(k / m), wdr, F0 / m, x0, v0, tf,
+                            points_per_period)
 
 
 def forced_analytical(m=10, k=100, x0=1, v0=0,
-                           wdr=0.5, F0=10, tf=100):
+                           wdr=0.5, F0=10, tf=100, points_per_period=50):
 
     """
     Returns the response of an undamped single degree of freedom system
@@ -667,6 +1186,10 @@ def forced_analytical(m=10, k=100, x0=1, v0=0,
         Force magnitude
     tf: float
         End time
+    points_per_period: int
+        Samples per period of the faster of the natural and the force
+        frequency. Use `forced_analytical_response` to evaluate only
+        some times.
 
     Returns
     ----------
@@ -674,20 +1197,96 @@ def forced_analytical(m=10, k=100, x0=1, v0=0,
         Time and displacement
 
     Examples:
-    >>> forced_analytical(m=10, k=100, x0=1, v0=0, wdr=0.5, F0=10, tf=100)
-    (array([  0.00000000e+00,   1.25000156e-04,   2.50000313e-04, ...,
-             9.99997500e+01,   9.99998750e+01,   1.00000000e+02]), array([ 1.        ,  0.99999993,  0.99999972, ..., -0.32885349,
-           -0.32916361, -0.32947367]))"""
+    >>> t, x = forced_analytical(m=10, k=100, x0=1, v0=0, wdr=0.5, F0=10, tf=100)
+    >>> len(t)
+    2518
+    >>> print(round(x[-1], 6))
+    -0.329474
+    """
+    r = forced_analytical_response(m, k, x0, v0, wdr, F0, tf,
+                                   points_per_period)
+    t = r.t
+    return t, r(t)
 
-    t = sp.linspace(0, tf, tf/0.000125)
 
+def forced_response_batch(m=10, c=0, k=100, x0=1, v0=0,
+                          wdr=0.5, F0=10, max_time=100):
+    """
+    Returns the response of many single degree of freedom systems to the
+    sinusoidal force F0*cos(wdr*t) at once using the closed form
+    solution instead of an ode solver.
+
+    The arguments are broadcast against each other and every
+    combination is a case, typically an array of drive frequencies wdr
+    and/or amplitudes F0. The response is the steady state
+    X*cos(wdr*t - phi) plus the free response (see `free_response_batch`)
+    to the initial conditions left over, for any damping. An undamped
+    system driven at resonance grows as t*sin(omega*t), its X is inf.
+
+    Parameters
+    ----------
+    m, c, k: float or array
+        Mass, damping and stiffness
+    x0, v0: float or array
+        Initial conditions
+    wdr: float or array
+        Force frequency
+    F0: float or array
+        Force magnitude
+    max_time: float
+        End time
+
+    Returns
+    ----------
+    t: array
+        Time, shape (n_time,). Same grid as `forced_response`.
+    x, v: array
+        Displacement and velocity, shape (n_drive, n_time)
+    X, phi: array
+        Steady state amplitude and phase lag, shape (n_drive,)
+
+    Examples:
+    >>> wdr = np.linspace(0.5, 6, 1000)
+    >>> t, x, v, X, phi = forced_response_batch(c=2, wdr=wdr, max_time=20)
+    >>> x.shape
+    (1000, 5000)
+    >>> print(round(X.max(), 4), round(wdr[X.argmax()], 3))
+    1.5819 3.159
+    """
+
+    m, c, k, x0, v0, wdr, F0 = [
+        a.ravel() for a in np.broadcast_arrays(
+            *[np.asarray(a, dtype=float)
+              for a in (m, c, k, x0, v0, wdr, F0)])]
+
+    t = np.linspace(0, max_time, int(250 * max_time))
+    omega = np.sqrt(k / m)
+    zeta = c / 2 / omega / m
     f0 = F0 / m
-    w = sp.sqrt(k / m)
-    x = (v0 / w * sp.sin(w * t) +
-         (x0 - f0 / (w**2 - wdr**2)) * sp.cos(w * t) +
-         f0 / (w**2 - wdr**2) * sp.cos(wdr * t))   # (2.11)
 
-    return t, x
+    # steady state x = Re(Xc*exp(i*wdr*t)), (2.29)-(2.30)
+    den = omega ** 2 - wdr ** 2 + 2j * zeta * omega * wdr
+    res = den == 0
+    Xc = f0 / np.where(res, 1, den)
+    Xc[res] = 0
+    X = np.abs(Xc)
+    X[res] = np.inf
+    phi = np.arctan2(2 * zeta * omega * wdr, omega ** 2 - wdr ** 2)
+    phi[res] = np.pi / 2
+
+    x, v = _free_grid(omega, zeta, x0 - Xc.real, v0 + wdr * Xc.imag, t)
+    e = _exp_grid(1j * wdr, t[1] - t[0], len(t), Xc)
+    x += e.real
+    v -= (e * wdr[:, None]).imag
+
+    if res.any():
+        # undamped resonance, (2.17)
+        a = (f0[res] / (2 * omega[res]))[:, None]
+        wt = omega[res][:, None] * t
+        x[res] += a * t * np.sin(wt)
+        v[res] += a * (np.sin(wt) + wt * np.cos(wt))
+
+    return t, x, v, X, phi
 
 
 def forced_response(m=10, c=0, k=100, x0=1, v0=0,
@@ -720,20 +1319,122 @@ def forced_response(m=10, c=0, k=100, x0=1, v0=0,
     >>> f[0][0]
     0.0"""
 
-    def sdofs_deriv(x_xd, t, m=m, c=c, k=k):
-        x, xd = x_xd
-        return [xd, (F0*sp.cos(wdr*t) / m) - (c / m) * xd - (k / m) * x]
+    t, x, y, _, _ = forced_response_batch(m, c, k, x0, v0, wdr, F0, max_time)
+    return t, x[0], y[0]
 
-    z0 = sp.array([x0, v0])
-    # Solve for the trajectories
-    t = sp.linspace(0, max_time, int(250 * max_time))
-    z_t = integrate.odeint(sdofs_deriv, z0, t)
 
-    x, y = z_t.T
-    return t, x, y
+def frequency_grid(fmin, fmax, fn=(), zeta=0.01, n=200, n_peak=41):
+    """
+    Returns a frequency grid that is coarse except around the natural
+    frequencies fn, where it is refined in proportion to the half-power
+    bandwidth 2*zeta*fn of each peak.
+
+    Near a peak, n_peak points are placed uniformly in the phase of the
+    modal response, f = fn + zeta*fn*tan(phi). Lightly damped peaks are
+    resolved with a fixed number of points, however narrow they are.
+    The refinement reaches one coarse spacing either side of fn, where
+    it blends into the n uniform points from fmin to fmax. The grid can
+    be passed to the analytical FRF functions (`f` of the
+    euler_beam_frf functions, `r` of steady_state_response,
+    transmissibility and rotating_unbalance, with fn=1 there).
+
+    Parameters
+    ----------
+    fmin, fmax: float
+        Frequency range
+    fn: float or array
+        Known or estimated natural frequencies
+    zeta: float or array
+        Damping ratio, one for all or one per natural frequency
+    n: int
+        Number of points of the coarse uniform grid
+    n_peak: int
+        Number of points per peak. An odd number puts a point on fn.
+
+    Returns
+    ----------
+    f: array
+        Sorted frequencies
+
+    Examples:
+    >>> f = frequency_grid(0, 3, fn=1, zeta=1e-4)
+    >>> len(f)
+    241
+    >>> r, A = steady_state_response_data(1e-4, 0, 3, r=f)
+    >>> print(round(np.abs(A).max()))
+    5000
+    """
+    fn, zeta = np.broadcast_arrays(np.atleast_1d(np.asarray(fn, dtype=float)),
+                                   np.atleast_1d(np.asarray(zeta, dtype=float)))
+    df = (fmax - fmin) / max(n - 1, 1)
+    bw = zeta * fn
+    phi = np.arctan(df / bw)[:, None] * np.linspace(-1, 1, n_peak)
+    peaks = fn[:, None] + bw[:, None] * np.tan(phi)
+    f = np.concatenate((np.linspace(fmin, fmax, n), peaks.ravel()))
+    return np.unique(f[(f >= fmin) & (f <= fmax)])
+
+
+def _ratio_grid(rmin, rmax, n=None, dr=None, r=None):
+    """Frequency ratios from rmin to rmax, n points or dr apart."""
+    if r is not None:
+        return np.asarray(r, dtype=float)
+    if n is None:
+        if dr is None:
+            n = int(round(100 * (rmax - rmin)))
+        else:
+            n = int(round((rmax - rmin) / dr)) + 1
+    return np.linspace(rmin, rmax, n)
 
 
-def steady_state_response(zs, rmin, rmax):
+def steady_state_response_data(zs, rmin, rmax, n=None, dr=None, r=None):
+    """
+    Returns the steady state response of a single degree of freedom
+    damped system, without plotting. See `steady_state_response`.
+
+    All damping values are evaluated as one (n_zeta, n_r) broadcast,
+    written in place into the result, so e.g. 1000 damping values by
+    1e5 frequency ratios need no more memory than the result itself.
+
+    Parameters
+    ----------
+    zs: float or array
+        Damping values
+    rmin, rmax: float
+        Minimum and maximum frequency ratio
+    n: int, optional
+        Number of frequency ratios. Default is 100 per unit of r.
+    dr: float, optional
+        Spacing of the frequency ratios, used if n is not given
+    r: array, optional
+        Frequency ratios to use instead, e.g. from `frequency_grid`
+
+    Returns
+    ----------
+    r: Array
+        Array containing the values for the frequency ratio
+    A: Array
+        Complex amplitudes, one row per damping value
+
+    Examples:
+    >>> r, A = steady_state_response_data([0.1, 0.3, 0.8], 0, 2)
+    >>> A.shape
+    (3, 200)
+    >>> r, A = steady_state_response_data(np.linspace(0.01, 1, 1000), 0, 2.5, dr=0.01)
+    >>> A.shape
+    (1000, 251)
+    """
+
+    zs = np.atleast_1d(np.asarray(zs, dtype=float))[:, None]
+    r = _ratio_grid(rmin, rmax, n, dr, r)
+    A0 = np.empty((len(zs), len(r)), complex)
+    A0.real[...] = 1 - r**2
+    np.multiply(2 * r, zs, out=A0.imag)
+    np.reciprocal(A0, out=A0)
+
+    return r, A0
+
+
+def steady_state_response(zs, rmin, rmax, n=None, dr=None, r=None):
     """
     Returns a plot with the steady state response of a
     single degree of freedom damped system.
@@ -744,28 +1445,31 @@ def steady_state_response(zs, rmin, rmax):
         Array with the damping values
     rmin, rmax: float
         Minimum and maximum frequency ratio
+    n: int, optional
+        Number of frequency ratios. Default is 100 per unit of r.
+    dr: float, optional
+        Spacing of the frequency ratios, used if n is not given
+    r: array, optional
+        Frequency ratios to use instead, e.g. from `frequency_grid`
 
     Returns
     ----------
     r: Array
         Array containing the values for the frequency ratio
     A: Array
-        Array containing the values for anmplitude
+        Array containing the values for anmplitude, one row per
+        damping value
 
         Plot with steady state magnitude and phase
 
     Examples:
     >>> r, A = steady_state_response([0.1, 0.3, 0.8], 0, 2)
-    >>> A[10]
-    (0.98423159842039087-0.15988334018879749j)
+    >>> print(A[-1, 10])
+    (0.9842315984203909-0.1598833401887975j)
     """
 
-    if not isinstance(zs, list):
-        zs = [zs]
-    r = sp.linspace(rmin, rmax, 100*(rmax-rmin))
-    A0 = sp.zeros((len(zs), len(r)), complex)
-    for z in enumerate(zs):
-        A0[z[0]] = (1/(1 - r**2 + 2*1j*r*z[1]))
+    zs = np.atleast_1d(zs)
+    r, A0 = steady_state_response_data(zs, rmin, rmax, n, dr, r)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(211)
@@ -780,17 +1484,68 @@ def steady_state_response(zs, rmin, rmax):
     ax2.set_title('Phase vs Frequency Ratio')
 
     for A in A0:
-        ax1.plot(r, (sp.absolute(A)))
-        ax2.plot(r, -sp.angle(A)/sp.pi*180)
+        ax1.plot(r, (np.absolute(A)))
+        ax2.plot(r, -np.angle(A)/np.pi*180)
 
     ax1.legend((['$\zeta$ = ' + (str(s)) for s in zs]))
 
     _ = plt.show()
 
-    return r, A
+    return r, A0
+
+
+def transmissibility_data(zs, rmin, rmax, n=None, dr=None, r=None):
+    """
+    Returns the displacement and force transmissibility ratios of a
+    single degree of freedom damped system, without plotting. See
+    `transmissibility`.
+
+    All damping values are evaluated as one (n_zeta, n_r) broadcast,
+    computed in place in the two result arrays.
 
+    Parameters
+    ----------
+    zs: float or array
+        Damping values
+    rmin, rmax: float
+        Minimum and maximum frequency ratio
+    n: int, optional
+        Number of frequency ratios. Default is 100 per unit of r.
+    dr: float, optional
+        Spacing of the frequency ratios, used if n is not given
+    r: array, optional
+        Frequency ratios to use instead, e.g. from `frequency_grid`
 
-def transmissibility(zs, rmin, rmax):
+    Returns
+    ----------
+    r: Array
+        Array containing the values for the frequency ratio
+    DT: Array
+        Displacement transmissibility, one row per damping value
+    FT: Array
+        Force transmissibility, one row per damping value
+
+    Examples:
+    >>> r, DT, FT = transmissibility_data([0.01, 0.05, 0.1, 0.25, 0.5, 0.7], 0, 2)
+    >>> DT.shape
+    (6, 200)
+    """
+
+    zs = np.atleast_1d(np.asarray(zs, dtype=float))[:, None]
+    r = _ratio_grid(rmin, rmax, n, dr, r)
+    # 2.71, DT = sqrt((1 + (2 z r)**2)/((1 - r**2)**2 + (2 z r)**2))
+    FT = np.multiply(2 * r, zs)
+    FT **= 2
+    DT = FT + 1
+    FT += (1 - r**2)**2
+    DT /= FT
+    np.sqrt(DT, out=DT)
+    np.multiply(DT, r**2, out=FT)
+
+    return r, DT, FT
+
+
+def transmissibility(zs, rmin, rmax, n=None, dr=None, r=None):
     """
     Returns a plot Displacement transmissibility ratio
     and force transmissibility ratio of a single degree
@@ -802,35 +1557,34 @@ def transmissibility(zs, rmin, rmax):
         Array with the damping values
     rmin, rmax: float
         Minimum and maximum frequency ratio
+    n: int, optional
+        Number of frequency ratios. Default is 100 per unit of r.
+    dr: float, optional
+        Spacing of the frequency ratios, used if n is not given
+    r: array, optional
+        Frequency ratios to use instead, e.g. from `frequency_grid`
 
     Returns
     ----------
     r: Array
         Array containing the values for the frequency ratio
     D: Array
-        Array containing the values for displacement
+        Array containing the values for displacement, one row per
+        damping value
     F: Array
-        Array containing the values for force
+        Array containing the values for force, one row per damping value
 
         Plot with Displacement transmissibility ratio
         and force transmissibility ratio
 
     Examples:
     >>> r, D, F = transmissibility([0.01, 0.05, 0.1, 0.25, 0.5, 0.7], 0, 2)
-    >>> D[10]
+    >>> print(D[-1, 10])
     1.0100027508815634
     """
 
-    if not isinstance(zs, list):
-        zs = [zs]
-    r = sp.linspace(rmin, rmax, 100*(rmax-rmin))
-    DT = sp.zeros((len(zs), len(r)))
-    for z in enumerate(zs):
-        # 2.71
-        DT[z[0]] = ((1 + (2 * z[1] * r)**2) /
-                    ((1 - r**2)**2 + (2 * z[1] * r)**2))**0.5
-
-    FT = (r**2)*DT
+    zs = np.atleast_1d(zs)
+    r, DT, FT = transmissibility_data(zs, rmin, rmax, n, dr, r)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(211)
@@ -856,10 +1610,61 @@ def transmissibility(zs, rmin, rmax):
 
     _ = plt.show()
 
-    return r, D, F
+    return r, DT, FT
+
+
+def rotating_unbalance_data(m, m0, e, zs, rmin, rmax, normalized=True,
+                            n=None, dr=None, r=None):
+    """
+    Returns the displacement of a system with rotating unbalance,
+    without plotting. See `rotating_unbalance`.
+
+    All damping values are evaluated as one (n_zeta, n_r) broadcast,
+    written in place into the result.
+
+    Parameters
+    ----------
+    m: float
+        Mass of the system
+    m0, e: float
+        Mass and eccentricity of the unbalance.
+    zs: float or array
+        Damping values
+    rmin, rmax: float
+        Minimum and maximum frequency ratio
+    normalized: bool
+        If true, the displacement is normalized (m*X/(m0*e))
+    n: int, optional
+        Number of frequency ratios. Default is 100 per unit of r.
+    dr: float, optional
+        Spacing of the frequency ratios, used if n is not given
+    r: array, optional
+        Frequency ratios to use instead, e.g. from `frequency_grid`
+
+    Returns
+    ----------
+    r: Array
+        Array containing the values for the frequency ratio
+    Xn: Array
+        Complex displacement, one row per damping value
 
+    Examples:
+    >>> r, Xn = rotating_unbalance_data(m=1, m0=0.5, e=0.1, zs=[0.1, 0.25, 0.707, 1], rmin=0, rmax=3.5, normalized=True)
+    >>> Xn.shape
+    (4, 350)
+    """
+
+    r, Xn = steady_state_response_data(zs, rmin, rmax, n, dr, r)
+    Xn *= r
 
-def rotating_unbalance(m, m0, e, zs, rmin, rmax, normalized=True):
+    if normalized==False:
+        Xn *= (m0 * e / m)
+
+    return r, Xn
+
+
+def rotating_unbalance(m, m0, e, zs, rmin, rmax, normalized=True, n=None,
+                       dr=None, r=None):
     """
     Returns a plot Displacement of a system with rotating
     unbalance.
@@ -876,29 +1681,33 @@ def rotating_unbalance(m, m0, e, zs, rmin, rmax, normalized=True):
         Minimum and maximum frequency ratio
     normalized: bool
         If true, the displacement is normalized (m*X/(m0*e))
+    n: int, optional
+        Number of frequency ratios. Default is 100 per unit of r.
+    dr: float, optional
+        Spacing of the frequency ratios, used if n is not given
+    r: array, optional
+        Frequency ratios to use instead, e.g. from `frequency_grid`
 
     Returns
     ----------
     r: Array
         Array containing the values for the frequency ratio
     Xn: Array
-        Array containing the values for displacement
+        Array containing the values for displacement, one row per
+        damping value
 
         Plot with Displacement displacement and phase
         for a system with rotating unbalance.
 
     Examples:
     >>> r, Xn = rotating_unbalance(m=1, m0=0.5, e=0.1, zs=[0.1, 0.25, 0.707, 1], rmin=0, rmax=3.5, normalized=True)
-    >>> Xn[1][10]
-    (0.10104614704226758-0.0051182602098315527j)
+    >>> print(Xn[1][10])
+    (0.10104614704226758-0.005118260209831553j)
     """
 
-    if not isinstance(zs, list):
-        zs = [zs]
-    r = sp.linspace(rmin, rmax, 100*(rmax-rmin))
-    Xn = sp.zeros((len(zs), len(r)), complex)
-    for z in enumerate(zs):
-        Xn[z[0]] = (r / (1 - r**2 + 2*1j*r*z[1]))
+    zs = np.atleast_1d(zs)
+    r, Xn = rotating_unbalance_data(m, m0, e, zs, rmin, rmax, normalized,
+                                    n, dr, r)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(211)
@@ -906,7 +1715,6 @@ def rotating_unbalance(m, m0, e, zs, rmin, rmax, normalized=True):
     plt.tight_layout()
 
     if normalized==False:
-        Xn = Xn * (m0 * e / m)
         ax1.set_ylabel('Displacement Magnitude')
         ax1.set_title('Displacement Magnitude vs Frequency Ratio')
     else:
@@ -918,8 +1726,8 @@ def rotating_unbalance(m, m0, e, zs, rmin, rmax, normalized=True):
     ax2.set_title('Phase vs Frequency Ratio')
 
     for X_z in Xn:
-        ax1.plot(r, sp.absolute(X_z))
-        ax2.plot(r, -sp.angle(X_z)/sp.pi*180)
+        ax1.plot(r, np.absolute(X_z))
+        ax2.plot(r, -np.angle(X_z)/np.pi*180)
 
     ax1.legend((['$\zeta$ = ' + (str(s)) for s in zs]))
 
@@ -928,6 +1736,30 @@ def rotating_unbalance(m, m0, e, zs, rmin, rmax, normalized=True):
     return r, Xn
 
 
+def impulse_response_data(m, c, k, Fo, max_time):
+    """
+    Returns the response of the system to an impulse of magnitude
+    Fo (N.s), without plotting. See `impulse_response`.
+
+    Examples:
+    >>> t, x = impulse_response_data(m=100, c=20, k=2000, Fo=10, max_time=100)
+    >>> print(round(x[10], 8))
+    0.00396298
+    """
+
+    t = np.linspace(0, max_time, int(250 * max_time))
+
+    wn = np.sqrt(k / m)
+    zeta = c / (2 * wn * m)
+    # imaginary when overdamped, sin(wd*t)/wd is then sinh(|wd|*t)/|wd|
+    wd = wn * np.emath.sqrt(1 - zeta**2)
+    fo = Fo / m
+
+    x = np.real(fo / (wd * np.exp(zeta * wn * t)) * np.sin(wd * t))
+
+    return t, x
+
+
 def impulse_response(m, c, k, Fo, max_time):
     """
     Returns a plot with the response of the system to an
@@ -954,18 +1786,11 @@ def impulse_response(m, c, k, Fo, max_time):
 
     Examples:
     >>> t, x = impulse_response(m=100, c=20, k=2000, Fo=10, max_time=100)
-    >>> x[10]
-    0.0039629845398805623
+    >>> print(x[10])
+    0.003962984539880562
     """
 
-    t = sp.linspace(0, max_time, int(250 * max_time))
-
-    wn = sp.sqrt(k / m)
-    zeta = c / (2 * wn * m)
-    wd = wn * sp.sqrt(1 - zeta**2)
-    fo = Fo / m
-
-    x = fo / (wd * sp.exp(zeta * wn * t)) * sp.sin(wd * t)
+    t, x = impulse_response_data(m, c, k, Fo, max_time)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(111)
@@ -979,6 +1804,188 @@ def impulse_response(m, c, k, Fo, max_time):
     return t, x
 
 
+class DuhamelResponse(object):
+    """
+    Response of a single degree of freedom system to force records by
+    FFT convolution with its sampled unit impulse response (the Duhamel
+    integral, rectangle rule), with zero initial conditions.
+
+    The kernel h(t) (see `impulse_response_data`, any damping) is built
+    once, from t = 0 until it has decayed to tol of its first peak or to
+    max_time. Calling the object convolves whole records, many channels
+    in one transform. `process` and `stream` do the same block by block
+    by overlap-add, carrying the tail of each block into the next, so
+    the records can be of any length.
+
+    Parameters
+    ----------
+    m, c, k: float
+        Mass, damping and stiffness
+    dt: float
+        Time step of the force records
+    max_time: float, optional
+        Length of the kernel. Needed for undamped systems.
+    tol: float
+        Relative decay at which the kernel is cut, if max_time is not given
+
+    Attributes
+    ----------
+    h: array
+        Kernel, the impulse response times dt
+
+    Examples:
+    >>> t = np.arange(20000) * 1e-3
+    >>> f = np.vstack((np.sin(3 * t), np.ones_like(t)))
+    >>> d = DuhamelResponse(10, 100, 1000, 1e-3)
+    >>> x = d(f)
+    >>> x.shape
+    (2, 20000)
+    >>> print(round(x[1, -1], 6))
+    0.001
+    >>> blocks = np.split(f, 40, axis=1)
+    >>> print(np.allclose(np.hstack(list(d.stream(blocks))), x))
+    True
+    """
+
+    def __init__(self, m, c, k, dt, max_time=None, tol=1e-10):
+        omega = np.sqrt(k / m)
+        zeta = c / 2 / omega / m
+        if max_time is None:
+            # slowest decay rate, (1.36) and (1.41)
+            rate = omega * (zeta - np.sqrt(max(zeta ** 2 - 1, 0)))
+            if rate <= 0:
+                raise ValueError('max_time is needed for an undamped system')
+            max_time = np.log(1 / tol) / rate
+        t = np.arange(max(int(np.ceil(max_time / dt)) + 1, 2)) * dt
+        x, _ = _free_grid(np.array([omega]), np.array([zeta]), np.zeros(1),
+                          np.array([1 / m]), t)
+        self.h = x[0] * dt
+        self.dt = dt
+        self._tail = None
+        self._H = {}
+
+    def __call__(self, f):
+        """Response to the force records f, shape (n_time,) or
+        (n_channels, n_time)."""
+        f = np.asarray(f, dtype=float)
+        n = f.shape[-1]
+        h = self.h[:n]
+        return signal.fftconvolve(f, h.reshape((1,) * (f.ndim - 1) + (-1,)),
+                                  axes=-1)[..., :n]
+
+    def _kernel_fft(self, nfft):
+        H = self._H.get(nfft)
+        if H is None:
+            H = self._H[nfft] = np.fft.rfft(self.h, nfft)
+        return H
+
+    def process(self, f):
+        """
+        Response to the next block f of the records, shape (n_time,) or
+        (n_channels, n_time). The block length may change between calls.
+        Each call transforms block plus kernel length, so blocks about as
+        long as the kernel are the most efficient.
+        """
+        f = np.asarray(f, dtype=float)
+        n, nk = f.shape[-1], len(self.h)
+        nfft = next_fast_len(n + nk - 1)
+        y = np.fft.irfft(np.fft.rfft(f, nfft) * self._kernel_fft(nfft),
+                         nfft)[..., :n + nk - 1]
+        if self._tail is not None:
+            y[..., :nk - 1] += self._tail
+        self._tail = y[..., n:]
+        return y[..., :n]
+
+    def stream(self, blocks):
+        """Generator of the responses to an iterable of blocks, see
+        `process`. Starts from rest."""
+        self.reset()
+        for f in blocks:
+            yield self.process(f)
+
+    def reset(self):
+        """Forget the blocks seen by `process`, back to rest."""
+        self._tail = None
+
+    def __repr__(self):
+        return '<DuhamelResponse: %d point kernel, dt=%g>' % (len(self.h),
+                                                               self.dt)
+
+
+def convolution_response(m, c, k, f, t, max_time=None):
+    """
+    Returns the response of a single degree of freedom system to sampled
+    force records by FFT convolution with its impulse response, starting
+    from rest. See `DuhamelResponse` for long records processed in
+    blocks and `response` for an exact recursive solution.
+
+    Parameters
+    ----------
+    m, c, k: float
+        Mass, damping and stiffness
+    f: array
+        Force at the times t, shape (n_time,) or (n_channels, n_time)
+    t: array
+        Uniformly spaced times
+    max_time: float, optional
+        Length of the kernel, see `DuhamelResponse`. Defaults to the end
+        of t for undamped systems.
+
+    Returns
+    ----------
+    t, x: array
+        Time and displacement, x with the shape of f
+
+    Examples:
+    >>> t = np.linspace(0, 20, 20001)
+    >>> t, x = convolution_response(10, 100, 1000, np.ones_like(t), t)
+    >>> print(round(x[-1] * 1000, 4))
+    1.0
+    """
+    t = np.asarray(t, dtype=float)
+    if max_time is None and c == 0:
+        max_time = t[-1] - t[0]
+    return t, DuhamelResponse(m, c, k, t[1] - t[0], max_time)(f)
+
+
+def step_response_data(m, c, k, Fo, max_time):
+    """
+    Returns the response of the system to a step of magnitude Fo,
+    without plotting. See `step_response`.
+
+    Examples:
+    >>> t, x = step_response_data(m=100, c=20, k=2000, Fo=10, max_time=100)
+    >>> print(round(x[10], 10))
+    7.9581e-05
+    """
+
+    t = np.linspace(0, max_time, int(250 * max_time))
+
+    wn = np.sqrt(k / m)
+    zeta = c / (2 * wn * m)
+    fo = Fo / m
+
+    if 0 < zeta < 1:
+        wd = wn * np.sqrt(1 - zeta**2)
+        phi = np.arctan(zeta / np.sqrt(1 - zeta**2))
+        x = fo / wn**2 * (1 - wn / wd*np.exp(-zeta * wn * t)*np.cos(wd * t - phi))
+    elif zeta == 1:
+        lam = -wn
+        A1 = -fo / wn**2
+        A2 = -A1 * lam
+        x = fo / wn**2 + A1 * np.exp(lam * t) + A2 * t * np.exp(lam * t)
+    elif zeta > 1:
+        lam1 = -zeta * wn - wn * np.sqrt(zeta**2 - 1)
+        lam2 = -zeta * wn + wn * np.sqrt(zeta**2 - 1)
+        A2 = fo / (wn**2 * (lam2 / lam1 - 1))
+        A1 = -lam2 / lam1 * A2
+        x = fo / wn**2 + A1 * np.exp(lam1 * t) + A2 * np.exp(lam2 * t)
+    else:
+        raise ValueError('Zeta should be greater than zero')
+
+    return t, x
+
+
 def step_response(m, c, k, Fo, max_time):
     """
     Returns a plot with the response of the system to an
@@ -1005,35 +2012,11 @@ def step_response(m, c, k, Fo, max_time):
 
     Examples:
     >>> t, x = step_response(m=100, c=20, k=2000, Fo=10, max_time=100)
-    >>> x[10]
-    7.9581008173000833e-05
+    >>> print(x[10])
+    7.958100817300083e-05
     """
 
-    t = sp.linspace(0, max_time, int(250 * max_time))
-
-    wn = sp.sqrt(k / m)
-    zeta = c / (2 * wn * m)
-    wd = wn * sp.sqrt(1 - zeta**2)
-    fo = Fo / m
-
-    if zeta != 1:
-        phi = sp.arctan(zeta / sp.sqrt(1 - zeta**2))
-
-    if 0 < zeta < 1:
-        x = fo / wn**2 * (1 - wn / wd*sp.exp(-zeta * wn * t)*sp.cos(wd * t - phi))
-    elif zeta == 1:
-        lam = -wn
-        A1 = -fo / wn**2
-        A2 = -A1 * lam
-        x = fo / wn**2 + A1 * sp.exp(lam * t) + A2 * t * sp.exp(lam * t)
-    elif zeta > 1:
-        lam1 = -zeta * wn - wn * sp.sqrt(zeta**2 - 1)
-        lam2 = -zeta * wn + wn * sp.sqrt(zeta**2 - 1)
-        A2 = fo / (wn**2 * (lam2 / lam1 - 1))
-        A1 = -lam2 / lam1 * A2
-        x = fo / wn**2 + A1 * sp.exp(lam1 * t) + A2 * sp.exp(lam2 * t)
-    else:
-        raise ValueError('Zeta should be greater than zero')
+    t, x = step_response_data(m, c, k, Fo, max_time)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(111)
@@ -1047,6 +2030,29 @@ def step_response(m, c, k, Fo, max_time):
     return t, x
 
 
+def fourier_series_data(dat, t, n):
+    """
+    Returns the Fourier coefficients of a function, without plotting.
+    See `fourier_series`.
+
+    Examples:
+    >>> f = np.hstack((np.arange(-1, 1, .04), np.arange(1, -1, -.04)))
+    >>> f += 1
+    >>> t = np.arange(0, len(f))/len(f)
+    >>> a, b = fourier_series_data(f, t, 5)
+    >>> print(round(a[0], 8))
+    2.0
+    """
+
+    len_ = len(dat)/2
+    fs = (np.fft.fft(dat))/len_
+    a0 = fs[0]
+    a = np.real(np.hstack((a0, fs[1:len(fs/2)])))
+    b = -np.imag(fs[1:len(fs/2)])
+
+    return a, b
+
+
 def fourier_series(dat, t, n):
     """
     Fourier series approximation to a function.
@@ -1071,29 +2077,24 @@ def fourier_series(dat, t, n):
         The function also produces a plot of the approximation.
 
     Examples:
-    >>> f = sp.hstack((sp.arange(-1, 1, .04), sp.arange(1, -1, -.04)))
+    >>> f = np.hstack((np.arange(-1, 1, .04), np.arange(1, -1, -.04)))
     >>> f += 1
-    >>> t = sp.arange(0, len(f))/len(f)
+    >>> t = np.arange(0, len(f))/len(f)
     >>> a, b = fourier_series(f, t, 5)
-    >>> a[0]
+    >>> print(a[0])
     2.0
     """
 
-    len_ = len(dat)/2
-    fs = (sp.fft(dat))/len_
-    a0 = fs[0]
-    a = sp.real(sp.hstack((a0, fs[1:len(fs/2)])))
-    b = -sp.imag(fs[1:len(fs/2)])
-    len_ *= 2
-    dt = 2*sp.pi/len_
-    tp = sp.arange(0, 2*sp.pi, dt)
-    dataapprox = a[0]/2 + sp.zeros_like(dat)
+    a, b = fourier_series_data(dat, t, n)
+    dt = 2*np.pi/len(dat)
+    tp = np.arange(0, 2*np.pi, dt)
+    dataapprox = a[0]/2 + np.zeros_like(dat)
     fig = plt.figure()
     ax1 = fig.add_subplot(111)
     ax1.plot(t, dat)
 
     for i in range(1, n):
-        newdat = a[i]*sp.cos(tp*i) + b[i]*sp.sin(tp*i)
+        newdat = a[i]*np.cos(tp*i) + b[i]*np.sin(tp*i)
         dataapprox += newdat
         if i == n-1:
             ax1.plot(t, newdat)
@@ -1105,6 +2106,31 @@ def fourier_series(dat, t, n):
     return a, b
 
 
+def response_spectrum_data(f):
+    """
+    Returns the response spectrum to a partial ramp input for the
+    system with natural frequency f (in Hz) and no damping, without
+    plotting. See `response_spectrum`.
+
+    Examples:
+    >>> t, rs = response_spectrum_data(10)
+    >>> print(round(rs[10], 8))
+    1.62856024
+    """
+
+    t = np.linspace(.001 * 4 / f, 10 / f, 200)
+    w = 2 * np.pi * f
+
+    one = np.ones_like(t)
+
+    rs1 = one / (w * t)
+    rs2 = np.sqrt(2 * (1 - np.cos(w * t)))
+
+    rs = one + rs1 * rs2
+
+    return t, rs
+
+
 def response_spectrum(f):
     """
     Will display the response spectrum to a partial ramp
@@ -1123,19 +2149,11 @@ def response_spectrum(f):
         a plot with the response spectrum.
     Examples:
     >>> t, rs = response_spectrum(10)
-    >>> rs[10]
+    >>> print(rs[10])
     1.6285602401720802
     """
 
-    t = sp.linspace(.001 * 4 / f, 10 / f, 200)
-    w = 2 * sp.pi * f
-
-    one = sp.ones_like(t)
-
-    rs1 = one / (w * t)
-    rs2 = sp.sqrt(2 * (1 - sp.cos(w * t)))
-
-    rs = one + rs1 * rs2
+    t, rs = response_spectrum_data(f)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(111)
@@ -1149,6 +2167,36 @@ def response_spectrum(f):
     return t, rs
 
 
+def fourier_approximation_data(a0, aodd, aeven, bodd, beven, N, T):
+    """
+    Returns the Fourier series defined by the coefficients, without
+    plotting. See `fourier_approximation`.
+
+    Examples:
+    >>> t, F = fourier_approximation_data(0,'-8/pi**2/n**2',0,0,0,20,10)
+    >>> print(round(F[10], 8))
+    -0.90234929
+    """
+    args = [str(arg) for arg in [a0, aodd, aeven, bodd, beven]] # change to str
+    a0, aodd, aeven, bodd, beven = args
+
+    dt = min(T/400, T/10*N)
+    t = np.arange(0, T*3, dt)
+    F = 0*t + eval(a0)/2
+    pi = np.pi
+
+    for n in range(1, N):
+        if n % 2 == 0:
+            a = aeven
+            b = beven
+        else:
+            a = aodd
+            b = bodd
+        F = F + eval(a)*np.cos(n*2*np.pi*t/T) + eval(b)*np.sin(n*2*np.pi*t/T)
+
+    return t, F
+
+
 def fourier_approximation(a0, aodd, aeven, bodd, beven, N, T):
     """
     Plot the Fourier series defined by:
@@ -1175,29 +2223,14 @@ def fourier_approximation(a0, aodd, aeven, bodd, beven, N, T):
     Examples:
     >>> # Square wave
     >>> t, F = fourier_approximation(-1, 0, 0, '-3*(-1+(-1)**n)/n/pi', '-3*(-1+(-1)**n)/n/pi', 20, 2)
-    >>> F[10]
+    >>> print(F[10])
     1.2697210294282535
     >>> # Triangular wave
     >>> t, F = fourier_approximation(0,'-8/pi**2/n**2',0,0,0,20,10)
-    >>> F[10]
-    -0.90234928911935097
+    >>> print(F[10])
+    -0.902349289119351
     """
-    args = [str(arg) for arg in [a0, aodd, aeven, bodd, beven]] # change to str
-    a0, aodd, aeven, bodd, beven = args
-
-    dt = min(T/400, T/10*N)
-    t = sp.arange(0, T*3, dt)
-    F = 0*t + eval(a0)/2
-    pi = sp.pi
-
-    for n in range(1, N):
-        if n % 2 == 0:
-            a = aeven
-            b = beven
-        else:
-            a = aodd
-            b = bodd
-        F = F + eval(a)*sp.cos(n*2*sp.pi*t/T) + eval(b)*sp.sin(n*2*sp.pi*t/T)
+    t, F = fourier_approximation_data(a0, aodd, aeven, bodd, beven, N, T)
 
     fig = plt.figure()
     ax1 = fig.add_subplot(111)